@@ -1,34 +1,61 @@
 import tkinter as tk
 from tkinter import messagebox
-import math
 import random
+from tictactoe_engine import Board, choose_move, default_depth, predicted_move
+from search_stats import SearchStats
+from search_worker import SearchWorker
+from game_records import GAMES_FILE, append_game, tictactoe_game
+
+POLL_MS = 16  # How often the window checks for the AI's move
 
 class TicTacToe:
-    def __init__(self):
+    # A size x size board where k in a row wins (k defaults to size). stats_file is a
+    # JSON lines file the search stats of every AI move are appended to, and every game
+    # is appended to record_file (see game_records.py) unless it's None.
+    def __init__(self, size=3, k=None, stats_file=None, record_file=GAMES_FILE):
+        self.size = size
+        self.k = k or size
+        self.stats_file = stats_file
+        self.record_file = record_file
+        # The AI searches on a background worker, and ponders its answer to the player's
+        # most likely move while the player thinks.
+        self.worker = SearchWorker()
+        # Limit the search to 5 plies on 3x3 (the AI move plus 4 replies) to save computation time.
+        self.depth = 5 if size == 3 else default_depth(size)
         self.window = tk.Tk()
         self.window.title("Tic Tac Toe")
         
         # Set a fixed window size.
-        self.window.geometry("300x350")  # Width = 3*100 (for buttons) + 6 (for grid lines), Height includes restart button and window title.
+        self.window.geometry(f"{100 * size}x{100 * size + 50}")  # Width = size*100 (for buttons), Height includes restart button and window title.
         self.window.resizable(False, False)
         
         self.initialize_game_state()
         self.initialize_board()
+        self.window.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.window.after(POLL_MS, self.poll_ai)
         self.window.mainloop()
 
     def initialize_game_state(self):
         # Initialize game state variables
         self.current_player = "O"
-        self.board = [" "] * 9
+        self.board = Board(self.size, self.k)
         self.game_over = False
         self.buttons = []
         self.First_Move = True
+        self.thinking = False
+        self.pondered = None  # (predicted move, (the AI's answer, its stats)) from a finished ponder
+        self.new_seed()
+
+    def new_seed(self):
+        # The seed of the game's random choices, recorded with the game so they can be replayed.
+        self.seed = random.getrandbits(32)
+        self.rng = random.Random(self.seed)
 
     def initialize_board(self):
         button_size = 100  # Size in pixels for each button
-        for i in range(9):
+        for i in range(self.size * self.size):
             frame = tk.Frame(self.window, width=button_size, height=button_size)
-            frame.grid(row=i // 3, column=i % 3)
+            frame.grid(row=i // self.size, column=i % self.size)
             frame.pack_propagate(False)  # Prevent the frame from resizing to fit the button
             button = tk.Button(frame, text='', font="Arial 20", command=lambda i=i: self.on_button_click(i))
             button.pack(expand=True, fill='both')  # Make the button fill the frame
@@ -36,105 +63,108 @@ class TicTacToe:
 
         # Restart button
         self.restart_button = tk.Button(self.window, text="Restart", font="Arial 20", command=self.restart_game)
-        self.restart_button.grid(row=3, column=0, columnspan=3, sticky="ew")
+        self.restart_button.grid(row=self.size, column=0, columnspan=self.size, sticky="ew")
 
         if self.current_player == "O":
             self.ai_move()
 
     def on_button_click(self, i):
-        # Make a move for human player and then for AI.
-        if self.board[i] == " " and not self.game_over:
+        # Make a move for human player and then for AI. Clicks while the AI is thinking are ignored.
+        if self.board[i] == " " and not self.game_over and not self.thinking:
             self.make_move(i, "X")
             if not self.game_over:
-                self.ai_move()
+                self.ai_move(played=i)
 
     def make_move(self, i, player):
         # Place the player's symbol on the board and check for end game.
-        self.board[i] = player
+        self.board.make_move(i, player)
         self.buttons[i].config(text=player)
         self.check_end_game(player)
 
-    def ai_move(self):
+    def ai_move(self, played=None):
         # If it's the first move of the AI, choose a random position
         if self.First_Move:
             self.First_Move = False
             empty_indices = [i for i, x in enumerate(self.board) if x == " "]
-            random_place = random.choice(empty_indices)
-            self.make_move(random_place, "O")
-        else:
-            # AI performs a move using the minimax algorithm with alpha-beta pruning.
-            best_score = -float('inf')
-            best_move = None
-            for i in range(9):
-                if self.board[i] == " ":
-                    self.board[i] = "O"
-                    score = self.minimax(0, False, -float('inf'), float('inf'))
-                    self.board[i] = " "
-                    if score > best_score:
-                        best_score = score
-                        best_move = i
-            if best_move is not None:
-                self.make_move(best_move, "O")
-
-    def minimax(self, depth, is_maximizing, alpha, beta):
-        # Minimax algorithm with alpha-beta pruning and depth control.
-        if self.check_winner("O"):
-            return 1
-        if self.check_winner("X"):
-            return -1
-        if all(space != " " for space in self.board):
-            return 0
-
-        if depth == 4:  # Limit the depth to 4 recursive calls to save computation time.
-            return 0
-
-        if is_maximizing:
-            best_score = -float('inf')
-            for i in range(9):
-                if self.board[i] == " ":
-                    self.board[i] = "O"
-                    score = self.minimax(depth + 1, False, alpha, beta)
-                    self.board[i] = " "
-                    best_score = max(best_score, score)
-                    alpha = max(alpha, score)
-                    if beta <= alpha:
-                        break
-            return best_score
+            random_place = self.rng.choice(empty_indices)
+            self.finish_ai_move((random_place, 0), None)
+            return
+        # AI performs a move using the minimax algorithm with alpha-beta pruning, on the
+        # worker so the window stays responsive. poll_ai plays the move when it's found.
+        self.thinking = True
+        pondered, self.pondered = self.pondered, None
+        if pondered is not None and pondered[0] == played:
+            self.finish_ai_move(*pondered[1])  # The player made the predicted move
+        elif self.worker.tag == ("ponder", played):
+            self.worker.retag("move")  # Predicted too, and the ponder is still searching it
         else:
-            best_score = float('inf')
-            for i in range(9):
-                if self.board[i] == " ":
-                    self.board[i] = "X"
-                    score = self.minimax(depth + 1, True, alpha, beta)
-                    self.board[i] = " "
-                    best_score = min(best_score, score)
-                    beta = min(beta, score)
-                    if beta <= alpha:
-                        break
-            return best_score
+            self.worker.start(self.search_job(self.board.copy()), "move")
+
+    def search_job(self, board):
+        # A search of board for the AI on the worker, giving ((move, value), stats).
+        stats = SearchStats() if self.stats_file else None
+        return lambda stop: (choose_move(board, "O", self.depth, stats, stop), stats)
+
+    def ponder(self):
+        # Search the AI's answer to the player's predicted move while they think.
+        board = self.board.copy()
+        guess = predicted_move(board, "X")
+        board.make_move(guess, "X")
+        if board.winner() is None and not board.is_full():
+            self.worker.start(self.search_job(board), ("ponder", guess))
+
+    def poll_ai(self):
+        # Check for a finished search about 60 times a second.
+        result = self.worker.poll()
+        if result is not None:
+            tag, (solved, stats) = result
+            if tag == "move":
+                self.finish_ai_move(solved, stats)
+            else:
+                self.pondered = (tag[1], (solved, stats))
+        self.window.after(POLL_MS, self.poll_ai)
+
+    def finish_ai_move(self, solved, stats):
+        # Play the AI's move and start pondering on the player's turn.
+        self.thinking = False
+        best_move, best_score = solved
+        if best_move is None:
+            return
+        self.make_move(best_move, "O")
+        if stats is not None:
+            stats.append_to(self.stats_file)
+        if not self.game_over:
+            self.ponder()
 
     def check_winner(self, player):
         # Check if the player has won.
-        win_conditions = [(0, 1, 2), (3, 4, 5), (6, 7, 8),
-                          (0, 3, 6), (1, 4, 7), (2, 5, 8),
-                          (0, 4, 8), (2, 4, 6)]
-        for condition in win_conditions:
-            if all(self.board[i] == player for i in condition):
-                return True
-        return False
+        return self.board.winner() == player
 
     def check_end_game(self, player):
         # Check for a win or draw and announce the game's end.
         if self.check_winner(player):
+            self.record_game()
             messagebox.showinfo("Game Over", f"Player {player} wins!")
             self.game_over = True
-        elif all(space != " " for space in self.board):
+        elif self.board.is_full():
+            self.record_game()
             messagebox.showinfo("Game Over", "It's a draw!")
             self.game_over = True
 
+    def record_game(self, finished=True):
+        # Append the game to record_file; unfinished games are recorded when they're restarted or closed.
+        if self.record_file is not None and self.board.history:
+            append_game(self.record_file, tictactoe_game(self.board, self.seed, "O", "O", finished))
+
     def restart_game(self):
         # Reset the game state to start a new game.
-        self.board = [" "] * 9
+        self.worker.cancel()
+        if not self.game_over:
+            self.record_game(False)
+        self.new_seed()
+        self.thinking = False
+        self.pondered = None
+        self.board = Board(self.size, self.k)
         for button in self.buttons:
             button.config(text="", state="normal")
         self.current_player = "O"
@@ -142,5 +172,13 @@ class TicTacToe:
         self.First_Move = True  # Reset this flag for the new game
         self.ai_move()
 
+    def on_close(self):
+        # Stop the search before closing the window.
+        self.worker.cancel()
+        if not self.game_over:
+            self.record_game(False)
+        self.game_over = True
+        self.window.destroy()
+
 if __name__ == "__main__":
     TicTacToe()
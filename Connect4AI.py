@@ -1,266 +1,330 @@
-import numpy as np
 import pygame
 import sys
 import math
-from threading import Timer
+import os
 import random
+import time
+from connect4_engine import (ROWS, COLS, AI_PIECE, PLAYER_PIECE, SearchTimeout, TranspositionTable, best_move,
+                             create_board, drop_piece, get_next_open_row, is_terminal_node, is_valid_location,
+                             iterative_deepening, predicted_move, winning_move)
+from connect4_book import BOOK_FILE, OpeningBook
+from connect4_parallel import ParallelSearch
+from connect4_solver import SOLVER_TABLE_FILE, Solver
+from game_records import GAMES_FILE, append_game, connect4_game
+from search_stats import SearchStats
+from search_worker import SearchWorker
 # Initial variables
-ROWS = 5
-COLS = 5
-AI_PIECE = 2
-PLAYER_PIECE = 1
-EMPTY = 0
-WINDOW_LENGTH = 4
+AI_TIME_MS = 1000  # Thinking time for every AI move
+AI_WORKERS = 1  # Above 1, the AI search is split over this many processes
+AI_STATS_FILE = None  # JSON lines file to append the search stats of every AI move to
+AI_PONDER = True  # Search the player's predicted move during their turn (minimax with AI_WORKERS 1 only)
+AI_BOOK_FILE = BOOK_FILE  # Opening book the AI plays from when it exists, see connect4_book.py
+AI_ENGINE = "minimax"  # Or "mcts" for Monte Carlo tree search (connect4_mcts.py, needs NumPy)
+AI_SOLVER = False  # Play perfectly with connect4_solver instead of the timed search, see connect4_solver.py
+FPS = 60  # The window keeps redrawing and handling events at this rate while the AI thinks
+RECORD_FILE = GAMES_FILE  # Every game is appended to this record file (see game_records.py), None for no records
 # Game colors
 BLUE = (0, 0, 255)
 BLACK = (0, 0, 0)
 RED = (255, 0, 0)
 YELLOW = (255, 255, 0)
 
-# Function to create the game board
-def create_board():
-    return np.zeros((ROWS, COLS))
-
-# Function to drop a piece in the board
-def drop_piece(board, row, col, piece):
-    board[row][col] = piece
-
-# Check if the column is a valid location
-def is_valid_location(board, col):
-    return board[ROWS-1][col] == 0
-
-# Get the next open row in the chosen column
-def get_next_open_row(board, col):
-    for r in range(ROWS):
-        if board[r][col] == 0:
-            return r
-
-# Check if the last move was a winning move
-def winning_move(board, piece):
-    # Check all horizontal locations
-    for c in range(COLS - 3):
-        for r in range(ROWS):
-            if board[r][c] == piece and board[r][c+1] == piece and board[r][c+2] == piece and board[r][c+3] == piece:
-                return True
-
-    # Check all vertical locations
-    for c in range(COLS):
-        for r in range(ROWS - 3):
-            if board[r][c] == piece and board[r+1][c] == piece and board[r+2][c] == piece and board[r+3][c] == piece:
-                return True
-
-    # Check positively sloped diagonals
-    for c in range(COLS - 3):
-        for r in range(ROWS - 3):
-            if board[r][c] == piece and board[r+1][c+1] == piece and board[r+2][c+2] == piece and board[r+3][c+3] == piece:
-                return True
-
-    # Check negatively sloped diagonals
-    for c in range(COLS - 3):
-        for r in range(3, ROWS):
-            if board[r][c] == piece and board[r-1][c+1] == piece and board[r-2][c+2] == piece and board[r-3][c+3] == piece:
-                return True
-
-# Function to evaluate the board (heuristic)
-def evaluate_window(window, piece):
-    score = 0
-    opp_piece = PLAYER_PIECE
-    if piece == PLAYER_PIECE:
-        opp_piece = AI_PIECE
-
-    if window.count(piece) == 4:
-        score += 100
-    elif window.count(piece) == 3 and window.count(EMPTY) == 1:
-        score += 5
-    elif window.count(piece) == 2 and window.count(EMPTY) == 2:
-        score += 2
-
-    if window.count(opp_piece) == 3 and window.count(EMPTY) == 1:
-        score -= 4
-
-    return score
-
-# Score the position of the board
-def score_position(board, piece):
-    score = 0
-
-    # Score center column
-    center_array = [int(i) for i in list(board[:, COLS//2])]
-    center_count = center_array.count(piece)
-    score += center_count * 3
-
-    # Score Horizontal
-    for r in range(ROWS):
-        row_array = [int(i) for i in list(board[r,:])]
-        for c in range(COLS-3):
-            window = row_array[c:c+WINDOW_LENGTH]
-            score += evaluate_window(window, piece)
-
-    # Score Vertical
-    for c in range(COLS):
-        col_array = [int(i) for i in list(board[:,c])]
-        for r in range(ROWS-3):
-            window = col_array[r:r+WINDOW_LENGTH]
-            score += evaluate_window(window, piece)
-
-    # Score positive sloped diagonal
-    for r in range(ROWS-3):
-        for c in range(COLS-3):
-            window = [board[r+i][c+i] for i in range(WINDOW_LENGTH)]
-            score += evaluate_window(window, piece)
-
-    # Score negative sloped diagonal
-    for r in range(ROWS-3):
-        for c in range(COLS-3):
-            window = [board[r+3-i][c+i] for i in range(WINDOW_LENGTH)]
-            score += evaluate_window(window, piece)
-
-    return score
-
-# Function to check if the game is over
-def is_terminal_node(board):
-    return winning_move(board, PLAYER_PIECE) or winning_move(board, AI_PIECE) or len(get_valid_locations(board)) == 0
-
-# Get all valid locations
-def get_valid_locations(board):
-    valid_locations = []
-    for col in range(COLS):
-        if is_valid_location(board, col):
-            valid_locations.append(col)
-    return valid_locations
-def animate_drop_piece(board, row, col, piece, screen, color):
-    for r in range(row, -1, -1):
-        pygame.draw.rect(screen, BLACK, (col*SQUARESIZE, 0, SQUARESIZE, height))
-        if piece == PLAYER_PIECE:
-            pygame.draw.circle(screen, RED, (int(col*SQUARESIZE+SQUARESIZE/2), int((ROWS-r)*SQUARESIZE+SQUARESIZE/2)), RADIUS)
+DROP_ACCELERATION = 110  # Squares per second per second a dropped disc falls at
+AI_MOVE_DELAY_MS = 250  # The AI's disc starts to fall this long after its move is found
+FRAME_TIMES = "--frame-times" in sys.argv  # Print how long the frames took when the game ends
+
+# Draws the game into screen and sends only the parts that changed to the display.
+# The board frame (with transparent holes) and the discs are drawn once into
+# sprites; a change redraws its dirty rectangle from them, discs first and the frame
+# over them, so falling discs pass behind the frame. flush() updates the display
+# with the rectangles changed since the last flush.
+class Renderer:
+    def __init__(self, screen, board, squaresize, font):
+        self.screen = screen
+        self.board = board
+        self.font = font
+        self.square = squaresize
+        radius = int(squaresize / 2 - 5)
+        self.frame = pygame.Surface((COLS * squaresize, ROWS * squaresize), pygame.SRCALPHA)
+        self.frame.fill(BLUE)
+        for c in range(COLS):
+            for r in range(ROWS):
+                pygame.draw.circle(self.frame, (0, 0, 0, 0), (c * squaresize + squaresize // 2,
+                                                               r * squaresize + squaresize // 2), radius)
+        self.frame = self.frame.convert_alpha()
+        self.discs = {}
+        for piece, color in ((PLAYER_PIECE, RED), (AI_PIECE, YELLOW)):
+            disc = pygame.Surface((2 * radius + 1, 2 * radius + 1), pygame.SRCALPHA)
+            pygame.draw.circle(disc, color, (radius, radius), radius)
+            self.discs[piece] = disc.convert_alpha()
+        self.falling = []  # [row, col, piece, start time, current rect] of the discs dropping
+        self.hover = None  # (piece, rect) of the disc following the mouse
+        self.label = None  # (text surface, rect) of the game's result
+        self.dirty = []
+        self.redraw(screen.get_rect())
+
+    # Rect of the disc of piece centered at (x, y)
+    def disc_rect(self, piece, x, y):
+        return self.discs[piece].get_rect(center=(int(x), int(y)))
+
+    def cell_rect(self, row, col, piece):
+        return self.disc_rect(piece, col * self.square + self.square / 2,
+                              (ROWS - row) * self.square + self.square / 2)
+
+    # Draw everything inside rect again and mark it for the next flush
+    def redraw(self, rect):
+        rect = rect.clip(self.screen.get_rect())
+        if not rect.width or not rect.height:
+            return
+        screen = self.screen
+        screen.set_clip(rect)
+        screen.fill(BLACK, rect)
+        falling = {(row, col) for row, col, _, _, _ in self.falling}
+        for col in range(max(0, rect.left // self.square), min(COLS, (rect.right - 1) // self.square + 1)):
+            for row in range(self.board.heights[col]):
+                if (row, col) not in falling:
+                    piece = self.board.piece_at(row, col)
+                    screen.blit(self.discs[piece], self.cell_rect(row, col, piece))
+        for _, _, piece, _, disc in self.falling:
+            if disc is not None:
+                screen.blit(self.discs[piece], disc)
+        if self.hover is not None:
+            screen.blit(self.discs[self.hover[0]], self.hover[1])
+        if self.label is not None:
+            screen.blit(*self.label)
+        screen.blit(self.frame, (0, self.square))
+        screen.set_clip(None)
+        self.dirty.append(rect)
+
+    # Show piece's disc above column x, or no disc when piece is None
+    def move_hover(self, x, piece):
+        old = self.hover
+        self.hover = None if piece is None else (piece, self.disc_rect(piece, x, self.square / 2))
+        if old is not None:
+            self.redraw(old[1])
+        if self.hover is not None:
+            self.redraw(self.hover[1])
+
+    # Animate the disc just played at (row, col), starting delay_ms from now. The board
+    # already has it; it's drawn in its cell when it lands.
+    def drop(self, row, col, piece, delay_ms=0):
+        self.falling.append([row, col, piece, time.perf_counter() + delay_ms / 1000, None])
+
+    def show_label(self, text, color):
+        label = self.font.render(text, 1, color)
+        self.label = (label, label.get_rect(topleft=(40, 10)))
+        self.redraw(self.label[1])
+
+    # Move the falling discs to where they are at time now
+    def update(self, now):
+        for disc in self.falling[:]:
+            row, col, piece, start, old = disc
+            if now < start:
+                continue
+            # From the top row down, speeding up as it falls
+            y = self.square / 2 + DROP_ACCELERATION * self.square * (now - start) ** 2 / 2
+            if y >= (ROWS - row) * self.square + self.square / 2:
+                self.falling.remove(disc)
+                new = self.cell_rect(row, col, piece)
+            else:
+                new = disc[4] = self.disc_rect(piece, col * self.square + self.square / 2, y)
+            self.redraw(new if old is None else new.union(old))
+
+    def animating(self):
+        return bool(self.falling)
+
+    # Send the dirty rectangles to the display; returns the number of pixels sent
+    def flush(self):
+        if not self.dirty:
+            return 0
+        pygame.display.update(self.dirty)
+        area = sum(rect.width * rect.height for rect in self.dirty)
+        self.dirty = []
+        return area
+
+
+# Frame times of the game loop for --frame-times: the time each frame took to handle
+# events and draw, apart from the wait for the next frame, and the pixels it sent
+class FrameTimer:
+    def __init__(self, pixels):
+        self.pixels = pixels
+        self.times = []
+        self.areas = []
+
+    def add(self, seconds, area):
+        self.times.append(seconds)
+        self.areas.append(area)
+
+    def report(self):
+        if not self.times:
+            return
+        times = sorted(self.times)
+        drawn = [area for area in self.areas if area]
+        print(f"{len(times)} frames: median {times[len(times) // 2] * 1000:.2f} ms, "
+              f"95th percentile {times[int(len(times) * 0.95)] * 1000:.2f} ms, max {times[-1] * 1000:.2f} ms; "
+              f"{len(drawn)} frames updated the display, "
+              f"{100 * sum(drawn) / max(1, len(drawn)) / self.pixels:.1f}% of the window each on average")
+
+# Start the AI's search on the worker thread, on a copy of the board since the game
+# loop keeps drawing it. The result is the column to play.
+def start_ai_search(worker, board, table, parallel, budget_ms, book=None, solver_table=None, mcts=None):
+    position = board.copy()
+    stats = SearchStats() if AI_STATS_FILE else None
+    def search(stop):
+        if solver_table is not None:
+            try:
+                return Solver(solver_table, stop).best_move(position)[0]
+            except SearchTimeout:
+                return None
+        if mcts is not None:
+            col = mcts.search(position, budget_ms, stop=stop, stats=stats)[0]
+        elif parallel is not None:
+            col = parallel.best_move(position, budget_ms, stats, book, stop)
         else:
-            pygame.draw.circle(screen, YELLOW, (int(col*SQUARESIZE+SQUARESIZE/2), int((ROWS-r)*SQUARESIZE+SQUARESIZE/2)), RADIUS)
-        pygame.display.update()
-        pygame.time.wait(50)  # Wait 50 milliseconds
-    board[row][col] = piece
-
-# Minimax algorithm with Alpha-Beta pruning
-def minimax(board, depth, alpha, beta, maximizingPlayer):
-    valid_locations = get_valid_locations(board)
-    is_terminal = is_terminal_node(board)
-    if depth == 0 or is_terminal:
-        if is_terminal:
-            if winning_move(board, AI_PIECE):
-                return (None, math.inf)
-            elif winning_move(board, PLAYER_PIECE):
-                return (None, -math.inf)
-            else:  # Game is over, no more valid moves
-                return (None, 0)
-        else:  # Depth is zero
-            return (None, score_position(board, AI_PIECE))
-    if maximizingPlayer:
-        value = -np.inf
-        column = random.choice(valid_locations)
-        for col in valid_locations:
-            row = get_next_open_row(board, col)
-            b_copy = board.copy()
-            drop_piece(b_copy, row, col, AI_PIECE)
-            new_score = minimax(b_copy, depth-1, alpha, beta, False)[1]
-            if new_score > value:
-                value = new_score
-                column = col
-            alpha = max(alpha, value)
-            if alpha >= beta:
-                break
-        return column, value
-
-    else:  # Minimizing player
-        value = np.inf
-        column = random.choice(valid_locations)
-        for col in valid_locations:
-            row = get_next_open_row(board, col)
-            b_copy = board.copy()
-            drop_piece(b_copy, row, col, PLAYER_PIECE)
-            new_score = minimax(b_copy, depth-1, alpha, beta, True)[1]
-            if new_score < value:
-                value = new_score
-                column = col
-            beta = min(beta, value)
-            if alpha >= beta:
-                break
-        return column, value
-
-# Function to draw the board
-# ... (Your existing draw_board function should be here)
-def draw_board(board):
-    for c in range(COLS):
-        for r in range(ROWS):
-            pygame.draw.rect(screen, BLUE, (c*SQUARESIZE, r*SQUARESIZE+SQUARESIZE, SQUARESIZE, SQUARESIZE))
-            pygame.draw.circle(screen, BLACK, (int(c*SQUARESIZE+SQUARESIZE/2), int(r*SQUARESIZE+SQUARESIZE+SQUARESIZE/2)), RADIUS)
-    
-    for c in range(COLS):
-        for r in range(ROWS):        
-            if board[r][c] == PLAYER_PIECE:
-                pygame.draw.circle(screen, RED, (int(c*SQUARESIZE+SQUARESIZE/2), height-int(r*SQUARESIZE+SQUARESIZE/2)), RADIUS)
-            elif board[r][c] == AI_PIECE: 
-                pygame.draw.circle(screen, YELLOW, (int(c*SQUARESIZE+SQUARESIZE/2), height-int(r*SQUARESIZE+SQUARESIZE/2)), RADIUS)
-    pygame.display.update()
+            col = best_move(position, budget_ms, table, stats, stop, book)
+        if stats is not None and not stop.is_set():
+            stats.append_to(AI_STATS_FILE)
+        return col
+    worker.start(search, "move")
+
+# Ponder during the player's turn: search the position after their predicted move until
+# they move. Returns (predicted column, time pondering started) or None.
+def start_ponder(worker, board, table):
+    col = predicted_move(board, table)
+    position = board.copy()
+    position.make_move(col)
+    if is_terminal_node(position):
+        return None
+    worker.start(lambda stop: iterative_deepening(position, None, table, stop=stop), ("ponder", col))
+    return col, time.perf_counter()
+
+# Append the game on board to RECORD_FILE
+def record_game(board, seed, finished=True):
+    if RECORD_FILE is not None and board.moves:
+        append_game(RECORD_FILE, connect4_game(board, seed, AI_PIECE, finished))
 
 # Main game loop
-board = create_board()
-game_over = False
-turn = random.randint(PLAYER_PIECE, AI_PIECE)
-
-pygame.init()
-
-SQUARESIZE = 100
-width = COLS * SQUARESIZE
-height = (ROWS + 1) * SQUARESIZE
-size = (width, height)
-RADIUS = int(SQUARESIZE / 2 - 5)
-
-screen = pygame.display.set_mode(size)
-draw_board(board)
-pygame.display.update()
-
-myfont = pygame.font.SysFont("monospace", 75)
-
-while not game_over:
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            sys.exit()
-
-        if event.type == pygame.MOUSEMOTION:
-            pygame.draw.rect(screen, BLACK, (0, 0, width, SQUARESIZE))
-            posx = event.pos[0]
-            if turn == PLAYER_PIECE:
-                pygame.draw.circle(screen, RED, (posx, int(SQUARESIZE / 2)), RADIUS)
-
-        if event.type == pygame.MOUSEBUTTONDOWN:
-            pygame.draw.rect(screen, BLACK, (0, 0, width, SQUARESIZE))
-            if turn == PLAYER_PIECE:
-                
-                posx = event.pos[0]
-                col = int(math.floor(posx / SQUARESIZE))
-                
-                if is_valid_location(board, col):
-                    row = get_next_open_row(board, col)
-                    animate_drop_piece(board, row, col, PLAYER_PIECE, screen, RED)
-                    if winning_move(board, PLAYER_PIECE):
-                        label = myfont.render("Player 1 wins!", 1, RED)
-                        screen.blit(label, (40, 10))
-                        game_over = True
-                    turn = AI_PIECE
-        pygame.display.update()
-
-        if turn == AI_PIECE and not game_over:
-            col, minimax_score = minimax(board, 5, -math.inf, math.inf, True)
+if __name__ == "__main__":
+    seed = random.getrandbits(32)  # Recorded with the game, so its random choices can be replayed
+    rng = random.Random(seed)
+    turn = rng.randint(PLAYER_PIECE, AI_PIECE)
+    board = create_board(turn)
+    table = TranspositionTable()  # Kept for the whole game so AI turns reuse earlier work
+    book = OpeningBook(AI_BOOK_FILE) if os.path.exists(AI_BOOK_FILE) else None
+    mcts = None
+    parallel = None
+    if AI_ENGINE == "mcts":
+        from connect4_mcts import MCTS
+        mcts = MCTS(AI_WORKERS)  # Kept for the whole game so its tree carries over
+    elif AI_WORKERS > 1:
+        parallel = ParallelSearch(AI_WORKERS)
+    solver_table = None
+    if AI_SOLVER:
+        solver_table = TranspositionTable()  # Solved results, kept like table
+        if os.path.exists(SOLVER_TABLE_FILE):
+            solver_table.load(SOLVER_TABLE_FILE)
+    worker = SearchWorker()
+    pondering = None  # (predicted column, time pondering started) during the player's turn
+    game_over = False
+
+    pygame.init()
+
+    SQUARESIZE = 100
+    width = COLS * SQUARESIZE
+    height = (ROWS + 1) * SQUARESIZE
+    size = (width, height)
+
+    screen = pygame.display.set_mode(size)
+    myfont = pygame.font.SysFont("monospace", 75)
+    renderer = Renderer(screen, board, SQUARESIZE, myfont)
+    renderer.flush()
+
+    clock = pygame.time.Clock()
+    frame_timer = FrameTimer(width * height) if FRAME_TIMES else None
+
+    while not game_over:
+        frame_start = time.perf_counter()
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                worker.cancel()
+                record_game(board, seed, False)
+                if frame_timer is not None:
+                    frame_timer.report()
+                sys.exit()
+
+            if event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                renderer.redraw(screen.get_rect())
+
+            if event.type == pygame.MOUSEMOTION:
+                renderer.move_hover(event.pos[0], PLAYER_PIECE if turn == PLAYER_PIECE else None)
+
+            if event.type == pygame.MOUSEBUTTONDOWN:
+                renderer.move_hover(event.pos[0], None)
+                if turn == PLAYER_PIECE:
+
+                    posx = event.pos[0]
+                    col = int(math.floor(posx / SQUARESIZE))
+
+                    if is_valid_location(board, col):
+                        row = get_next_open_row(board, col)
+                        drop_piece(board, row, col, PLAYER_PIECE)
+                        renderer.drop(row, col, PLAYER_PIECE)
+                        if winning_move(board, PLAYER_PIECE):
+                            renderer.show_label("Player 1 wins!", RED)
+                            game_over = True
+                        elif board.moves == ROWS * COLS:
+                            renderer.show_label("Draw!", BLUE)
+                            game_over = True
+                        turn = AI_PIECE
+                        worker.cancel()
+                        if not game_over:
+                            # The ponder on the predicted move filled the table, so the
+                            # search only needs what's left of the AI's time
+                            budget_ms = AI_TIME_MS
+                            if pondering is not None and pondering[0] == col:
+                                budget_ms = max(0, AI_TIME_MS - (time.perf_counter() - pondering[1]) * 1000)
+                            start_ai_search(worker, board, table, parallel, budget_ms, book, solver_table, mcts)
+                        pondering = None
+
+        if turn == AI_PIECE and not game_over and not worker.busy():
+            start_ai_search(worker, board, table, parallel, AI_TIME_MS, book, solver_table, mcts)  # The AI moves first
+
+        result = worker.poll()
+        if result is not None and result[0] == "move":
+            col = result[1]
             if is_valid_location(board, col):
-                pygame.time.wait(250)
                 row = get_next_open_row(board, col)
-                animate_drop_piece(board, row, col, AI_PIECE, screen, YELLOW)
+                drop_piece(board, row, col, AI_PIECE)
+                renderer.drop(row, col, AI_PIECE, AI_MOVE_DELAY_MS)
                 if winning_move(board, AI_PIECE):
-                    label = myfont.render("AI wins!", 1, YELLOW)
-                    screen.blit(label, (40, 10))
+                    renderer.show_label("AI wins!", YELLOW)
+                    game_over = True
+                elif board.moves == ROWS * COLS:
+                    renderer.show_label("Draw!", BLUE)
                     game_over = True
                 turn = PLAYER_PIECE
 
-            draw_board(board)
-
-    if game_over:
-        pygame.time.wait(3000)
\ No newline at end of file
+            if AI_PONDER and parallel is None and solver_table is None and mcts is None and not game_over:
+                pondering = start_ponder(worker, board, table)
+
+        renderer.update(time.perf_counter())
+        area = renderer.flush()
+        if frame_timer is not None:
+            frame_timer.add(time.perf_counter() - frame_start, area)
+        clock.tick(FPS)
+
+        if game_over:
+            worker.cancel()
+            record_game(board, seed)
+            # Let the last disc land, then keep the result on screen for a while
+            while renderer.animating():
+                frame_start = time.perf_counter()
+                pygame.event.pump()
+                renderer.update(time.perf_counter())
+                area = renderer.flush()
+                if frame_timer is not None:
+                    frame_timer.add(time.perf_counter() - frame_start, area)
+                clock.tick(FPS)
+            if frame_timer is not None:
+                frame_timer.report()
+            pygame.time.wait(3000)
\ No newline at end of file
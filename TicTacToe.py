@@ -1,60 +1,85 @@
 import tkinter as tk
 from tkinter import messagebox
-import math
 import random
+from tictactoe_engine import Board, choose_move, default_depth, predicted_move
+from tictactoe_table import lookup
+from game_records import GAMES_FILE, append_game, tictactoe_game
+from search_stats import SearchStats
+from search_worker import SearchWorker
+
+POLL_MS = 16  # How often the window checks for the AI's move (about 60 times a second)
 
 class TicTacToe:
-    def __init__(self):
+    # A size x size board where k in a row wins (k defaults to size).
+    # engine="table" plays 3x3 from the precomputed solution table (tictactoe_table.py),
+    # engine="minimax" searches every move; both choose the same moves. Searches run on
+    # a background worker, which ponders the AI's answer to the player's most likely
+    # move while the player thinks.
+    # stats_file is a JSON lines file the search stats of every AI move are appended to,
+    # and every game is appended to record_file (see game_records.py) unless it's None.
+    def __init__(self, size=3, k=None, engine="table", stats_file=None, record_file=GAMES_FILE):
+        self.size = size
+        self.k = k or size
+        self.engine = engine
+        self.stats_file = stats_file
+        self.record_file = record_file
+        self.depth = default_depth(size)
+        self.worker = SearchWorker()
+        self.pondered = None  # (predicted move, (the AI's answer, its stats)) from a finished ponder
         self.window = tk.Tk()
         self.window.title("Tic Tac Toe with Minimax")
-        self.window.minsize(300, 350)
-        self.buttons = [None] * 9
+        self.window.minsize(100 * size, 100 * size + 50)
+        self.buttons = [None] * (size * size)
         self.initialize_board()
-        self.first_move()
         self.game_over = False
+        self.first_move()
 
         # Restart button
         self.restart_button = tk.Button(self.window, text="Restart", font="Arial 20", height=1, width=6, bg="sky blue",
                                         command=self.restart_game)
-        self.restart_button.grid(row=3, column=0, columnspan=3, sticky="ew", padx=10, pady=10)
+        self.restart_button.grid(row=self.size, column=0, columnspan=self.size, sticky="ew", padx=10, pady=10)
 
         self.window.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.window.after(POLL_MS, self.poll_ai)
         self.window.mainloop()
 
     def initialize_board(self):
-        self.board = [" " for _ in range(9)]  #For the board as a
+        self.board = Board(self.size, self.k)  #For the board as a
 
         # Adjustments for the buttons
-        button_font = "Arial 30 bold"
+        button_font = f"Arial {max(12, 90 // self.size)} bold"
         button_height = 2
         button_width = 6
         button_bg = "white"
         button_active_bg = "dark grey"
 
-        for i in range(9):
+        for i in range(self.size * self.size):
             if self.buttons[i] is None:
                 button = tk.Button(self.window, text="", font=button_font, height=button_height, width=button_width, bg=button_bg,
                                    activebackground=button_active_bg,
                                    command=lambda i=i: self.on_button_click(i))
-                button.grid(row=i // 3, column=i % 3, padx=3, pady=3)
+                button.grid(row=i // self.size, column=i % self.size, padx=3, pady=3)
                 self.buttons[i] = button
             else:
                 self.buttons[i].config(text="", state="normal", bg=button_bg)
 
     def first_move(self):
+        self.seed = random.getrandbits(32)  # Recorded with the game, so its random choices can be replayed
+        self.rng = random.Random(self.seed)
         self.current_player = "O"
         self.ai_move(True)
 
     def on_button_click(self, i):
-        if self.board[i] == " " and not self.game_over:
+        # Clicks while the AI is thinking are ignored
+        if self.board[i] == " " and not self.game_over and self.current_player == "X":
             self.make_move(i,self.current_player)
 
             if not self.game_over:
                 self.current_player = "O"
-                self.ai_move()
+                self.ai_move(played=i)
 
     def make_move(self, i, player):
-        self.board[i] = player
+        self.board.make_move(i, player)
         if player == "X":
             self.buttons[i].configure(text=player, fg="blue")
         else:
@@ -62,88 +87,90 @@ class TicTacToe:
 
         # Check for win or draw and disable buttons if game is over
         if self.check_winner(player):
+            self.record_game()
             messagebox.showinfo("Game Over", f"Player {player} wins!")
             self.disable_buttons()
             self.game_over = True
         elif self.check_draw():
+            self.record_game()
             messagebox.showinfo("Game Over", "It's a draw!")
             self.disable_buttons()
             self.game_over = True
 
-    def ai_move(self, is_first=False):
+    # The AI's move after the player played cell played. A table lookup is played
+    # at once; a search runs on the worker and poll_ai plays its move.
+    def ai_move(self, is_first=False, played=None):
         if is_first:
-            random_place = random.randint(0,8)
-            self.make_move(random_place, self.current_player)
+            random_place = self.rng.randint(0, len(self.board) - 1)
+            self.finish_ai_move((random_place, 0), None)
+            return
+
+        pondered, self.pondered = self.pondered, None
+        if self.use_table():
+            stats = SearchStats() if self.stats_file else None
+            solved = lookup(self.board)
+            if stats is not None:
+                stats.finish(*solved, 0)  # A lookup searches no nodes
+            self.finish_ai_move(solved, stats)
+        elif pondered is not None and pondered[0] == played:
+            self.finish_ai_move(*pondered[1])  # The player made the predicted move
+        elif self.worker.tag == ("ponder", played):
+            self.worker.retag("move")  # Predicted too, and the ponder is still searching it
         else:
-            best_score = -math.inf
-            best_move = None
-
-            for i in range(len(self.board)):
-                if self.board[i] == " ":
-                    self.board[i] = self.current_player
-                    score = self.minimax(self.board, 0, False)
-                    self.board[i] = " "
-                    if score > best_score:
-                        best_score = score
-                        best_move = i
-
-            self.make_move(best_move, self.current_player)
+            self.worker.start(self.search_job(self.board.copy()), "move")
+
+    def use_table(self):
+        return self.engine == "table" and (self.size, self.k) == (3, 3)
+
+    # A search of board for the AI on the worker, giving ((move, value), stats)
+    def search_job(self, board):
+        stats = SearchStats() if self.stats_file else None
+        return lambda stop: (choose_move(board, "O", self.depth, stats, stop), stats)
+
+    # Ponder: search the AI's answer to the player's predicted move while they think
+    def ponder(self):
+        board = self.board.copy()
+        guess = predicted_move(board, "X")
+        board.make_move(guess, "X")
+        if board.winner() is None and not board.is_full():
+            self.worker.start(self.search_job(board), ("ponder", guess))
+
+    def poll_ai(self):
+        result = self.worker.poll()
+        if result is not None:
+            tag, (solved, stats) = result
+            if tag == "move":
+                self.finish_ai_move(solved, stats)
+            else:
+                self.pondered = (tag[1], (solved, stats))
+        self.window.after(POLL_MS, self.poll_ai)
+
+    def finish_ai_move(self, solved, stats):
+        best_move, best_score = solved
+        self.make_move(best_move, self.current_player)
+        if stats is not None:
+            stats.append_to(self.stats_file)
         self.current_player = "X" if self.current_player == "O" else "O"  # Switch players
+        if not self.game_over and not self.use_table():
+            self.ponder()
 
-    def minimax(self, board, depth, is_maximizing, alpha=-math.inf, beta=math.inf):
-        result = self.check_terminal()
-        if result is not None:
-            return result
-
-        if is_maximizing:
-            best_score = -math.inf
-            for i in range(len(board)):
-                if board[i] == " ":
-                    board[i] = "O"
-                    score = self.minimax(board, depth + 1, False, alpha, beta)
-                    board[i] = " "
-                    best_score = max(score, best_score)
-                    alpha = max(alpha, score)
-                    if beta <= alpha:
-                        break
-            return best_score
-        else:
-            best_score = math.inf
-            for i in range(len(board)):
-                if board[i] == " ":
-                    board[i] = "X"
-                    score = self.minimax(board, depth + 1, True, alpha, beta)
-                    board[i] = " "
-                    best_score = min(score, best_score)
-                    beta = min(beta, score)
-                    if beta <= alpha:
-                        break
-            return best_score
+    # Append the game to record_file; unfinished games are recorded when they're
+    # restarted or closed
+    def record_game(self, finished=True):
+        if self.record_file is not None and self.board.history:
+            append_game(self.record_file, tictactoe_game(self.board, self.seed, "O", "O", finished))
 
     def check_winner(self, player):
-        win_states = [
-            [0, 1, 2], [3, 4, 5], [6, 7, 8],
-            [0, 3, 6], [1, 4, 7], [2, 5, 8],
-            [0, 4, 8], [2, 4, 6]
-        ]
-        for state in win_states:
-            if all(self.board[i] == player for i in state):
-                return True
-        return False
+        return self.board.winner() == player
 
     def check_draw(self):
-        return all(cell != " " for cell in self.board)
-
-    def check_terminal(self):
-        if self.check_winner("X"):
-            return -1
-        if self.check_winner("O"):
-            return 1
-        if self.check_draw():
-            return False
-        return None
+        return self.board.is_full()
 
     def restart_game(self):
+        self.worker.cancel()
+        if not self.game_over:
+            self.record_game(False)
+        self.pondered = None
         self.game_over = False
         self.initialize_board()
         self.first_move()
@@ -153,6 +180,9 @@ class TicTacToe:
             button.config(state="disabled")
 
     def on_close(self):
+        self.worker.cancel()
+        if not self.game_over:
+            self.record_game(False)
         self.game_over = True
         self.window.destroy()
 
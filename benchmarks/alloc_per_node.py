@@ -0,0 +1,115 @@
+# Allocations per searched node: copy-per-child search (how minimax worked before
+# Position.make_move/unmake_move) against the in-place search in connect4_engine.minimax.
+#
+#   python benchmarks/alloc_per_node.py [depth]
+#
+# Both searches visit exactly the same nodes. "objects/node" and "bytes/node" count
+# the board objects (a Position and the five lists it owns) created per node;
+# "peak KiB" is the tracemalloc peak of the whole search.
+import math
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import connect4_engine as c4
+
+OPENING = [2, 2, 1, 3]
+
+
+POSITION_LISTS = ("boards", "heights", "window_states", "scores", "history")
+copies = 0
+
+
+# Count every board copy, whoever makes it
+def counting_copy(board, _copy=c4.Position.copy):
+    global copies
+    copies += 1
+    return _copy(board)
+
+
+c4.Position.copy = counting_copy
+
+
+# Size of one Position copy: the object and the lists it owns
+def copy_size(board):
+    return sys.getsizeof(board) + sum(sys.getsizeof(getattr(board, name)) for name in POSITION_LISTS)
+
+
+# The old search: the same alpha-beta and move ordering as minimax, but it copies
+# the board for every child
+def minimax_with_copies(board, depth, alpha, beta, maximizingPlayer, search):
+    search.check_time()
+    won = c4.last_move_won(board)
+    if won or board.moves == c4.ROWS * c4.COLS:
+        if not won:
+            return 0
+        return -math.inf if board.turn == c4.AI_PIECE else math.inf
+    if depth == 0:
+        return c4.score_position(board, c4.AI_PIECE)
+    piece = c4.AI_PIECE if maximizingPlayer else c4.PLAYER_PIECE
+    safe = None
+    if depth >= 2:
+        column, tactic_value, safe = c4.tactics(board, piece)
+        if column is not None:
+            return tactic_value
+    value = -math.inf if maximizingPlayer else math.inf
+    columns = c4.order_moves(board, piece, None, search)
+    if safe is not None:
+        columns = [col for col in columns if safe & c4.COLUMN_MASKS[col]]
+    for col in columns:
+        child = board.copy()
+        child.make_move(col, piece)
+        score = minimax_with_copies(child, depth - 1, alpha, beta, not maximizingPlayer, search)
+        if maximizingPlayer:
+            value = max(value, score)
+            alpha = max(alpha, value)
+        else:
+            value = min(value, score)
+            beta = min(beta, value)
+        if alpha >= beta:
+            search.cutoff(board, col, piece, depth)
+            break
+    return value
+
+
+# Run a search and return its result, time, board copies and peak traced memory
+def measure(run):
+    global copies
+    copies = 0
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = run()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, copies, peak
+
+
+def main():
+    depth = int(sys.argv[1]) if len(sys.argv) > 1 else 6
+    board = c4.create_board()
+    for i, col in enumerate(OPENING):
+        c4.drop_piece(board, c4.get_next_open_row(board, col), col, c4.PLAYER_PIECE if i % 2 == 0 else c4.AI_PIECE)
+
+    search = c4.Search()
+    value, *copy_run = measure(lambda: minimax_with_copies(board, depth, -math.inf, math.inf, True, search))
+    nodes = search.nodes
+
+    search = c4.Search()
+    (_, inplace_value), *inplace_run = measure(
+        lambda: c4.minimax(board, depth, -math.inf, math.inf, True, None, search))
+    assert inplace_value == value and search.nodes == nodes, "searches should visit the same tree"
+
+    objects = 1 + len(POSITION_LISTS)
+    print(f"depth {depth}, {nodes} nodes")
+    print(f"{'search':<16}{'objects/node':>14}{'bytes/node':>12}{'peak KiB':>10}{'nodes/s':>10}")
+    for name, (elapsed, made, peak) in (("copy per child", copy_run), ("make/unmake", inplace_run)):
+        print(f"{name:<16}{objects * made / nodes:>14.2f}{copy_size(board) * made / nodes:>12.0f}"
+              f"{peak / 1024:>10.1f}{nodes / elapsed:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+# Cold import time of connect4_engine: every run starts a fresh interpreter, so the
+# numbers include module setup (window tables, Zobrist keys) but not interpreter start.
+#
+#   python benchmarks/import_time.py [runs]
+#
+# Fails if the median is over LIMIT_MS or if importing pulled in pygame or NumPy.
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LIMIT_MS = 50
+
+PROBE = """
+import sys, time
+start = time.perf_counter()
+import connect4_engine
+elapsed = time.perf_counter() - start
+heavy = [name for name in ("pygame", "numpy") if name in sys.modules]
+print(elapsed * 1000, ",".join(heavy))
+"""
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    times = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", PROBE], cwd=ROOT, capture_output=True, text=True, check=True)
+        elapsed, _, heavy = out.stdout.strip().partition(" ")
+        if heavy:
+            sys.exit(f"importing connect4_engine loaded {heavy}")
+        times.append(float(elapsed))
+
+    median = statistics.median(times)
+    print(f"connect4_engine import over {runs} runs: median {median:.1f} ms, "
+          f"min {min(times):.1f} ms, max {max(times):.1f} ms")
+    if median > LIMIT_MS:
+        sys.exit(f"median import time is over {LIMIT_MS} ms")
+
+
+if __name__ == "__main__":
+    main()
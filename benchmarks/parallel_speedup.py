@@ -0,0 +1,54 @@
+# Speedup of ParallelSearch over the serial search against the number of workers.
+#
+#   python benchmarks/parallel_speedup.py [depth] [max workers]
+#
+# Every position is searched at a fixed depth; the serial time is minimax with a
+# fresh transposition table, as ParallelSearch.search gives each root move. The
+# parallel search must pick the same column, so a mismatch fails the run.
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from connect4_engine import AI_PIECE, PLAYER_PIECE, Search, TranspositionTable, minimax, position_from_moves
+from connect4_parallel import ParallelSearch
+
+POSITIONS = [
+    ([], AI_PIECE),
+    ([2, 2], AI_PIECE),
+    ([2, 1, 3], PLAYER_PIECE),
+    ([2, 2, 1, 3, 3, 2], AI_PIECE),
+]
+
+
+def main():
+    depth = int(sys.argv[1]) if len(sys.argv) > 1 else 9
+    max_workers = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count() or 1
+    boards = [position_from_moves(moves, first) for moves, first in POSITIONS]
+
+    expected = []
+    start = time.perf_counter()
+    for board in boards:
+        table = TranspositionTable()
+        expected.append(minimax(board, depth, -math.inf, math.inf, board.turn == AI_PIECE, table, Search(table)))
+    serial = time.perf_counter() - start
+    print(f"depth {depth}, {len(boards)} positions, {os.cpu_count()} cores")
+    print(f"{'workers':>8}{'seconds':>10}{'speedup':>10}")
+    print(f"{'serial':>8}{serial:>10.2f}{1:>10.2f}")
+
+    workers = 1
+    while workers <= max_workers:
+        with ParallelSearch(workers) as parallel:
+            start = time.perf_counter()
+            results = [parallel.search(board, depth) for board in boards]
+            elapsed = time.perf_counter() - start
+        if [col for col, _ in results] != [col for col, _ in expected]:
+            sys.exit(f"{workers} workers chose {results}, serial search chose {expected}")
+        print(f"{workers:>8}{elapsed:>10.2f}{serial / elapsed:>10.2f}")
+        workers *= 2
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+# Benchmark suite for the Connect4 and TicTacToe engines on the fixed positions of
+# benchmarks/positions.json (bump its version when the positions change).
+#
+#   python benchmarks/suite.py                   run and write benchmarks/results.json
+#   python benchmarks/suite.py --save-baseline   also store the results as the baseline
+#   python benchmarks/suite.py --threshold 10    fail on a slowdown of over 10% (default 20%)
+#
+# Connect4 positions are searched to a fixed depth (null: to the end of the game)
+# with a fresh transposition table; TicTacToe positions go through choose_move
+# (depth null is the exact search of TicTacToe.py, 5 is AnotherTicTacToe) or the
+# solution table. The RNG is seeded before every run. Like timeit, a timing sample
+# repeats the search until the runs add up to MIN_SECONDS, so even the quickest
+# positions are timed over enough runs to judge; each position reports the best time
+# per run over --repeat samples (setting up the position and table isn't timed),
+# nodes, nodes per second, peak traced memory (with the Connect4 transposition
+# table) and the chosen move. When a baseline exists, a position that got slower than
+# the baseline by more than --threshold percent fails the run.
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from connect4_engine import AI_PIECE, COLS, ROWS, Search, TranspositionTable, minimax, position_from_moves
+from search_stats import SearchStats
+from tictactoe_engine import Board, choose_move
+from tictactoe_table import lookup
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+POSITIONS = os.path.join(HERE, "positions.json")
+BASELINE = os.path.join(HERE, "baseline.json")
+RESULTS = os.path.join(HERE, "results.json")
+MIN_SECONDS = 0.2
+
+
+# Each game's setup builds the position (and table) for a run and returns the search
+# to time, which fills in stats. Connect4 searches a fresh table, or table cleared when
+# one is given: allocating 16 MB for each run would swamp the quick positions.
+def setup_connect4(position, stats, table=None):
+    board = position_from_moves(position["moves"], position["first"])
+    depth = position["depth"] or ROWS * COLS - board.moves
+    if table is None:
+        table = TranspositionTable()
+    else:
+        table.clear()
+
+    def search():
+        col, value = minimax(board, depth, -math.inf, math.inf, board.turn == AI_PIECE, table,
+                             Search(table, stats=stats))
+        stats.finish(col, value, depth)
+    return search
+
+
+def tictactoe_board(position):
+    board = Board(position.get("size", 3), position.get("k"))
+    for i, cell in enumerate(position["cells"]):
+        if cell != ".":
+            board.make_move(i, cell)
+    return board
+
+
+def setup_tictactoe(position, stats, table=None):
+    board = tictactoe_board(position)
+    return lambda: choose_move(board, position["player"], position["depth"], stats)
+
+
+def setup_tictactoe_table(position, stats, table=None):
+    cells = list(tictactoe_board(position))
+    return lambda: stats.finish(*lookup(cells), 0)
+
+
+SETUPS = {
+    "connect4": setup_connect4,
+    "tictactoe": setup_tictactoe,
+    "tictactoe-table": setup_tictactoe_table,
+}
+
+
+# Total search time of number runs, and the stats of the last one
+def run_sample(setup, position, seed, number, table):
+    elapsed = 0.0
+    for _ in range(number):
+        random.seed(seed)
+        stats = SearchStats()
+        search = setup(position, stats, table)
+        start = time.perf_counter()
+        search()
+        elapsed += time.perf_counter() - start
+    return elapsed, stats
+
+
+def measure(position, seed, repeat):
+    setup = SETUPS[position["game"]]
+
+    # Memory first: this run also warms up anything built on first use (the
+    # TicTacToe solution table), and tracing slows the search down too much to time it.
+    # The setup is traced too, so the peak includes the table the search fills.
+    random.seed(seed)
+    tracemalloc.start()
+    search = setup(position, SearchStats())
+    search()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    # Runs per sample: doubled until a sample takes MIN_SECONDS, which is then the
+    # first sample
+    table = TranspositionTable() if position["game"] == "connect4" else None
+    number = 1
+    while True:
+        elapsed, stats = run_sample(setup, position, seed, number, table)
+        if elapsed >= MIN_SECONDS:
+            break
+        number *= 2
+    best = elapsed / number
+    for _ in range(repeat - 1):
+        elapsed, stats = run_sample(setup, position, seed, number, table)
+        best = min(best, elapsed / number)
+
+    data = stats.as_dict()
+    return {
+        "name": position["name"],
+        "game": position["game"],
+        "depth": data["depth"],
+        "seconds": best,
+        "runs": number,
+        "nodes": stats.nodes,
+        "nodes_per_second": stats.nodes / best if best else 0.0,
+        "peak_kib": peak / 1024,
+        "move": data["move"],
+        "value": data["value"],
+    }
+
+
+# Slowdowns of results against baseline, printing every position's change
+def compare(results, baseline, threshold):
+    before = {result["name"]: result for result in baseline["results"]}
+    slower = []
+    print(f"\n{'position':<26}{'baseline':>12}{'now':>12}{'change':>9}")
+    for result in results["results"]:
+        old = before.get(result["name"])
+        if old is None:
+            print(f"{result['name']:<26}{'new':>12}")
+            continue
+        change = (result["seconds"] / old["seconds"] - 1) * 100 if old["seconds"] else 0.0
+        notes = []
+        if result["move"] != old["move"]:
+            notes.append(f"move {old['move']} -> {result['move']}")
+        if result["nodes"] != old["nodes"]:
+            notes.append(f"nodes {old['nodes']} -> {result['nodes']}")
+        if change > threshold:
+            slower.append(f"{result['name']} {change:+.1f}%")
+            notes.append("SLOWER")
+        print(f"{result['name']:<26}{old['seconds'] * 1000:>10.3f}ms{result['seconds'] * 1000:>10.3f}ms"
+              f"{change:>+8.1f}%  {', '.join(notes)}")
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the game engines on fixed positions")
+    parser.add_argument("--positions", default=POSITIONS)
+    parser.add_argument("--output", default=RESULTS, help="where to write the results as JSON")
+    parser.add_argument("--baseline", default=BASELINE, help="results to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the baseline")
+    parser.add_argument("--threshold", type=float, default=20.0, help="slowdown in percent that fails the run")
+    parser.add_argument("--repeat", type=int, default=5, help="timing samples per position, the fastest counts")
+    args = parser.parse_args()
+
+    with open(args.positions) as f:
+        suite = json.load(f)
+    results = {
+        "version": suite["version"],
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": [],
+    }
+    print(f"{'position':<26}{'depth':>6}{'seconds':>10}{'runs':>7}{'nodes':>10}{'nodes/s':>10}{'peak KiB':>10}"
+          f"{'move':>6}")
+    for position in suite["positions"]:
+        result = measure(position, suite["seed"], args.repeat)
+        results["results"].append(result)
+        print(f"{result['name']:<26}{result['depth']:>6}{result['seconds']:>10.4f}{result['runs']:>7}"
+              f"{result['nodes']:>10}{result['nodes_per_second']:>10.0f}{result['peak_kib']:>10.0f}{result['move']:>6}")
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=1)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=1)
+        print(f"\nbaseline saved to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"\nno baseline at {args.baseline}, run with --save-baseline to store one")
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline["version"] != results["version"]:
+        sys.exit(f"baseline is for positions version {baseline['version']}, not {results['version']}")
+    slower = compare(results, baseline, args.threshold)
+    if slower:
+        sys.exit(f"\nFAILED: {len(slower)} positions over {args.threshold:g}% slower than the baseline: "
+                 + ", ".join(slower))
+    print(f"\nno position over {args.threshold:g}% slower than the baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+# Batch evaluation of Connect4 positions with NumPy: score_position and winning_move
+# for a whole stack of boards in one call, for the leaves of a search frontier or for
+# bulk analysis of recorded games. Boards are arrays of shape (N, ROWS, COLS) holding
+# EMPTY, PLAYER_PIECE or AI_PIECE with row 0 at the bottom, like Position.piece_at.
+# Results are exactly those of connect4_engine.score_position and winning_move.
+#
+# Every window of the board is a row of WINDOW_CELLS. The boards are transposed to one
+# row per cell, so each window digit is a gather of whole rows; the digits add up to
+# one base-3 code per window and board, and lookup tables indexed by code give the
+# window score and whether it's four in a row. There is no Python code per board or
+# per cell.
+#
+# Throughput on one core (python connect4_batch.py measures it): about 5 million
+# boards/s for score_positions and 7 million for winning_moves on a million boards.
+# Large inputs are processed CHUNK boards at a time to bound the memory used.
+#
+# NumPy is only needed by this module; connect4_engine doesn't import it.
+import math
+import sys
+import time
+
+import numpy as np
+
+from connect4_engine import (AI_PIECE, COLS, EMPTY, H1, PLAYER_PIECE, ROWS, WINDOW_LENGTH, WINDOW_MASKS,
+                             evaluate_window, order_moves, winning_move)
+
+CHUNK = 1 << 16
+CENTER_COLUMN = COLS // 2
+
+# Cells (row * COLS + col) of every window, in the order of WINDOW_MASKS
+WINDOW_CELLS = np.array([[r * COLS + c for c in range(COLS) for r in range(ROWS) if mask >> (c * H1 + r) & 1]
+                         for mask in WINDOW_MASKS], dtype=np.intp)
+# WINDOW_DIGITS[i] is the i-th cell of every window
+WINDOW_DIGITS = [np.ascontiguousarray(WINDOW_CELLS[:, i]) for i in range(WINDOW_LENGTH)]
+CENTER_CELLS = np.array([r * COLS + CENTER_COLUMN for r in range(ROWS)], dtype=np.intp)
+CODE_TYPE = np.uint8 if 3 ** WINDOW_LENGTH <= 256 else np.uint16
+
+
+# SCORES[piece][code] is evaluate_window for piece of the window with that code, and
+# WINS[piece][code] whether it's WINDOW_LENGTH pieces of piece
+def _code_tables():
+    scores = np.zeros((3, 3 ** WINDOW_LENGTH), dtype=np.int16)
+    wins = np.zeros((3, 3 ** WINDOW_LENGTH), dtype=bool)
+    for code in range(3 ** WINDOW_LENGTH):
+        cells = [code // 3 ** i % 3 for i in range(WINDOW_LENGTH)]
+        for piece, opp in ((PLAYER_PIECE, AI_PIECE), (AI_PIECE, PLAYER_PIECE)):
+            scores[piece, code] = evaluate_window(cells.count(piece), cells.count(opp))
+            wins[piece, code] = cells.count(piece) == WINDOW_LENGTH
+    return scores, wins
+
+SCORES, WINS = _code_tables()
+
+
+# (N, ROWS, COLS) int8 array of Positions, unpacked from their bitboards
+def positions_to_array(positions):
+    nbytes = (COLS * H1 + 7) // 8
+    stacks = []
+    for piece in (PLAYER_PIECE, AI_PIECE):
+        raw = b"".join(position.boards[piece].to_bytes(nbytes, "little") for position in positions)
+        bits = np.unpackbits(np.frombuffer(raw, dtype=np.uint8).reshape(-1, nbytes), axis=1, bitorder="little")
+        stacks.append(bits[:, :COLS * H1].reshape(-1, COLS, H1)[:, :, :ROWS].transpose(0, 2, 1))
+    boards = stacks[0].astype(np.int8) * PLAYER_PIECE
+    boards += stacks[1].astype(np.int8) * AI_PIECE
+    return boards
+
+
+# Boards as one row per cell, shape (ROWS * COLS, N)
+def _cells(boards):
+    return np.ascontiguousarray(boards.reshape(len(boards), ROWS * COLS).T, dtype=CODE_TYPE)
+
+
+# Base-3 code of every window of every board, shape (number of windows, N)
+def window_codes(cells):
+    codes = cells[WINDOW_DIGITS[0]]
+    for i in range(1, WINDOW_LENGTH):
+        codes += cells[WINDOW_DIGITS[i]] * CODE_TYPE(3 ** i)
+    return codes
+
+
+def _chunked(function, boards, piece, dtype):
+    boards = np.asarray(boards)
+    out = np.empty(len(boards), dtype=dtype)
+    for start in range(0, len(boards), CHUNK):
+        out[start:start + CHUNK] = function(boards[start:start + CHUNK], piece)
+    return out
+
+
+def _score_chunk(boards, piece):
+    cells = _cells(boards)
+    center = np.count_nonzero(cells[CENTER_CELLS] == piece, axis=0) * 3
+    return center + SCORES[piece].take(window_codes(cells)).sum(axis=0, dtype=np.int32)
+
+
+def _win_chunk(boards, piece):
+    return WINS[piece].take(window_codes(_cells(boards))).any(axis=0)
+
+
+# score_position(board, piece) of every board, as an int array
+def score_positions(boards, piece):
+    return _chunked(_score_chunk, boards, piece, np.int32)
+
+
+# winning_move(board, piece) of every board, as a bool array
+def winning_moves(boards, piece):
+    return _chunked(_win_chunk, boards, piece, bool)
+
+
+# Values for the AI of every child of board (the piece to move playing each valid
+# column, in search order), scored in one batch the way minimax scores its leaves:
+# inf or -inf for a win, 0 for a full board, otherwise score_position for the AI.
+# Returns (columns, values).
+def child_values(board):
+    columns = order_moves(board, board.turn, None, None)
+    children = []
+    for col in columns:
+        board.make_move(col)
+        children.append(board.copy())
+        board.unmake_move()
+    cells = _cells(positions_to_array(children))
+    codes = window_codes(cells)
+    values = (np.count_nonzero(cells[CENTER_CELLS] == AI_PIECE, axis=0) * 3
+              + SCORES[AI_PIECE].take(codes).sum(axis=0)).astype(float)
+    values[cells.all(axis=0)] = 0
+    values[WINS[PLAYER_PIECE].take(codes).any(axis=0)] = -math.inf
+    values[WINS[AI_PIECE].take(codes).any(axis=0)] = math.inf
+    return columns, values
+
+
+# connect4_engine.minimax without a table or move ordering heuristics, with the last
+# ply expanded and scored by child_values in one call. Gives the same value as
+# minimax(board, depth, -inf, inf, maximizingPlayer) at the root; the column can
+# differ between moves of equal value, since minimax skips moves that lose at once
+# before searching. With at most COLS children per batch the NumPy call costs more
+# than the incremental scores of Position, so the AI keeps the scalar search; this
+# pays off on wider frontiers.
+def minimax_batched(board, depth, alpha, beta, maximizingPlayer):
+    if winning_move(board, AI_PIECE):
+        return None, math.inf
+    if winning_move(board, PLAYER_PIECE):
+        return None, -math.inf
+    if board.moves == ROWS * COLS:
+        return None, 0
+    if depth == 1:
+        columns, values = child_values(board)
+        best = int(np.argmax(values) if maximizingPlayer else np.argmin(values))
+        return columns[best], float(values[best])
+
+    columns = order_moves(board, board.turn, None, None)
+    column = columns[0]
+    value = -math.inf if maximizingPlayer else math.inf
+    for col in columns:
+        board.make_move(col)
+        new_score = minimax_batched(board, depth - 1, alpha, beta, not maximizingPlayer)[1]
+        board.unmake_move()
+        if maximizingPlayer:
+            if new_score > value:
+                value, column = new_score, col
+            alpha = max(alpha, value)
+        else:
+            if new_score < value:
+                value, column = new_score, col
+            beta = min(beta, value)
+        if alpha >= beta:
+            break
+    return column, value
+
+
+# Throughput of the batch functions on random positions
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    rng = np.random.default_rng(0)
+    boards = np.full((count, ROWS, COLS), EMPTY, dtype=np.int8)
+    # Fill every column from the bottom to a random height with random pieces
+    heights = rng.integers(0, ROWS + 1, size=(count, COLS))
+    pieces = rng.integers(PLAYER_PIECE, AI_PIECE + 1, size=(count, ROWS, COLS), dtype=np.int8)
+    filled = np.arange(ROWS)[None, :, None] < heights[:, None, :]
+    boards[filled] = pieces[filled]
+
+    for name, function in (("score_positions", score_positions), ("winning_moves", winning_moves)):
+        start = time.perf_counter()
+        function(boards, AI_PIECE)
+        elapsed = time.perf_counter() - start
+        print(f"{name}: {count} boards in {elapsed:.3f} s, {count / elapsed:,.0f} boards/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+# Connect4 opening book: deep fixed-depth search results for every position up to
+# some ply where the AI is to move, precomputed once into a sorted binary file. Pass
+# an OpeningBook to best_move (or iterative_deepening) and positions in the book are
+# answered by a lookup instead of a search.
+#
+#   python connect4_book.py --ply 6 --depth 12    build connect4_book.bin
+#
+# File layout, little-endian: a header, then the sorted uint64 position keys, then a
+# uint8 column and an int16 value (from the AI's point of view, BOOK_WIN for a win)
+# per key. A key is the bitboard of the pieces of the side to move plus the mask of
+# all pieces, COLS * (ROWS + 1) bits, so books fit boards up to 7x8. Positions and
+# their left-right mirror images share one entry, stored under the smaller key. The
+# file is memory-mapped read-only and searched by bisection, so opening it reads
+# nothing but the header, a lookup touches a handful of pages, and any number of
+# processes can map the same file and share it in the page cache.
+import argparse
+import bisect
+import math
+import mmap
+import os
+import struct
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from connect4_engine import (AI_PIECE, COLS, H1, PLAYER_PIECE, ROWS, Search, TranspositionTable, get_valid_locations,
+                             is_terminal_node, minimax, position_from_moves)
+
+BOOK_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "connect4_book.bin")
+MAGIC = b"C4BOOK2\0"
+HEADER = struct.Struct("<8sBBBBI")  # magic, ROWS, COLS, ply, depth, number of entries
+BOOK_WIN = 32767  # Stored value of a forced win (math.inf), -BOOK_WIN for a loss
+COLUMN_MASK = (1 << ROWS) - 1
+BOARD_BITS = COLS * H1
+KEY_ERROR = f"book keys don't fit 64 bits on a {ROWS}x{COLS} board"
+
+
+def _mirror(bits):
+    mirrored = 0
+    for c in range(COLS):
+        mirrored |= (bits >> (c * H1) & COLUMN_MASK) << ((COLS - 1 - c) * H1)
+    return mirrored
+
+
+# (book key, whether the key is of the mirror image) of board: the pieces of the side
+# to move plus the mask of all pieces, which adds a bit above every column's pieces,
+# for board or its mirror image, whichever is smaller. The key doesn't say which
+# piece is to move, but that follows from the piece count once the first player is
+# known, and the book only holds positions with the AI to move.
+def book_key(board):
+    current = board.boards[board.turn]
+    mask = board.boards[PLAYER_PIECE] | board.boards[AI_PIECE]
+    key = current + mask
+    mirrored = _mirror(current) + _mirror(mask)
+    return (mirrored, True) if mirrored < key else (key, False)
+
+
+class OpeningBook:
+    def __init__(self, path=BOOK_FILE):
+        if sys.byteorder != "little":
+            raise ValueError("opening books are little-endian")
+        if BOARD_BITS > 64:
+            raise ValueError(KEY_ERROR)
+        with open(path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, rows, cols, self.ply, self.depth, count = HEADER.unpack_from(self.map)
+        if magic != MAGIC or (rows, cols) != (ROWS, COLS):
+            self.map.close()
+            raise ValueError(f"{path} is not an opening book for a {ROWS}x{COLS} board")
+        view = memoryview(self.map)
+        start = HEADER.size
+        self.keys = view[start:start + 8 * count].cast("Q")
+        self.columns = view[start + 8 * count:start + 9 * count]
+        self.values = view[start + 9 * count:start + 11 * count].cast("h")
+
+    def __len__(self):
+        return len(self.keys)
+
+    # (column, value, depth) for board from the book, like iterative_deepening, or None
+    def probe(self, board):
+        if board.moves > self.ply or board.turn != AI_PIECE:
+            return None
+        key, mirrored = book_key(board)
+        i = bisect.bisect_left(self.keys, key)
+        if i == len(self.keys) or self.keys[i] != key:
+            return None
+        col = self.columns[i]
+        value = self.values[i]
+        if value == BOOK_WIN or value == -BOOK_WIN:
+            value = math.copysign(math.inf, value)
+        return (COLS - 1 - col if mirrored else col), value, self.depth
+
+    def close(self):
+        self.keys.release()
+        self.columns.release()
+        self.values.release()
+        self.map.close()
+
+
+# Every non-terminal position of at most ply moves with the AI to move, for either
+# side moving first, as move lists, one per book key
+def book_positions(ply):
+    positions = {}
+    for first in (PLAYER_PIECE, AI_PIECE):
+        frontier = {book_key(position_from_moves([], first))[0]: []}
+        for _ in range(ply + 1):
+            children = {}
+            for moves in frontier.values():
+                board = position_from_moves(moves, first)
+                if is_terminal_node(board):
+                    continue
+                if board.turn == AI_PIECE:
+                    positions.setdefault(book_key(board)[0], (moves, first))
+                for col in get_valid_locations(board):
+                    board.make_move(col)
+                    children.setdefault(book_key(board)[0], moves + [col])
+                    board.unmake_move()
+            frontier = children
+    return positions
+
+
+_table = None
+
+
+# Worker task: (column, value) of the position searched to depth with a fresh table
+def _search_position(moves, first, depth):
+    global _table
+    if _table is None:
+        _table = TranspositionTable()
+    _table.clear()
+    board = position_from_moves(moves, first)
+    return minimax(board, depth, -math.inf, math.inf, True, _table, Search(_table))
+
+
+# Search every book position of at most ply moves to depth and write the book to path
+def build_book(path, ply, depth, workers=1):
+    if BOARD_BITS > 64:
+        raise ValueError(KEY_ERROR)
+    positions = book_positions(ply)
+    keys = sorted(positions)
+    start = time.perf_counter()
+    with ProcessPoolExecutor(workers) as pool:
+        futures = [pool.submit(_search_position, *positions[key], depth) for key in keys]
+        results = []
+        for i, future in enumerate(futures):
+            results.append(future.result())
+            if (i + 1) % 100 == 0 or i + 1 == len(keys):
+                print(f"\r{i + 1}/{len(keys)} positions, {time.perf_counter() - start:.0f} s", end="", flush=True)
+    print()
+
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, ROWS, COLS, ply, depth, len(keys)))
+        f.write(struct.pack(f"<{len(keys)}Q", *keys))
+        columns = bytearray()
+        values = []
+        for key, (col, value) in zip(keys, results):
+            # The key may be the mirror image of the position that was searched
+            board = position_from_moves(*positions[key])
+            columns.append(COLS - 1 - col if book_key(board)[1] else col)
+            values.append(BOOK_WIN if value == math.inf else -BOOK_WIN if value == -math.inf else int(value))
+        f.write(bytes(columns))
+        f.write(struct.pack(f"<{len(values)}h", *values))
+    return len(keys)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the Connect4 opening book")
+    parser.add_argument("--ply", type=int, default=6, help="book positions with up to this many moves")
+    parser.add_argument("--depth", type=int, default=12, help="search depth of every book position")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--output", default=BOOK_FILE)
+    args = parser.parse_args()
+    count = build_book(args.output, args.ply, args.depth, args.workers)
+    print(f"{count} positions written to {args.output} ({os.path.getsize(args.output)} bytes)")
+
+
+if __name__ == "__main__":
+    main()
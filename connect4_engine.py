@@ -0,0 +1,740 @@
+# Connect4 engine: board representation, evaluation and search. It has no pygame
+# (or NumPy) dependency, so the AI can be imported by tools, tests and worker
+# processes without opening a window; Connect4AI.py is the pygame front-end.
+import math
+import random
+import time
+from array import array
+# Initial variables
+ROWS = 5
+COLS = 5
+AI_PIECE = 2
+PLAYER_PIECE = 1
+EMPTY = 0
+WINDOW_LENGTH = 4
+
+# Bitboard layout: every column takes ROWS+1 bits, row 0 at the bottom. The extra
+# bit on top of each column is never set, so shifted masks can't wrap into the
+# next column when we look for four in a row.
+H1 = ROWS + 1
+BOTTOM_MASK = sum(1 << (c * H1) for c in range(COLS))
+BOARD_MASK = BOTTOM_MASK * ((1 << ROWS) - 1)
+CENTER_MASK = ((1 << ROWS) - 1) << (COLS // 2 * H1)
+COLUMN_MASKS = [((1 << ROWS) - 1) << (c * H1) for c in range(COLS)]
+# Shifts for vertical, horizontal and the two diagonal directions
+WIN_SHIFTS = (1, H1, H1 + 1, H1 - 1)
+
+# Columns from the center outwards, the order moves are tried in
+CENTER_ORDER = sorted(range(COLS), key=lambda c: abs(2 * c - (COLS - 1)))
+
+# Zobrist keys: one random 64-bit number per (piece, cell) plus one for the side to move.
+# A fixed seed keeps keys identical between runs and processes.
+_zobrist_rng = random.Random(0xC0FFEE)
+ZOBRIST = [[_zobrist_rng.getrandbits(64) for _ in range(COLS * H1)] for _ in range(3)]
+ZOBRIST_AI_TO_MOVE = _zobrist_rng.getrandbits(64)
+
+# Position of the game: one integer mask per piece plus the height of every column.
+# Positions are changed in place with make_move() and unmake_move(), which keep an
+# undo stack, so searching them doesn't need to copy the board.
+class Position:
+    __slots__ = ("boards", "heights", "moves", "key", "window_states", "scores", "turn", "history")
+
+    def __init__(self, turn=PLAYER_PIECE):
+        self.boards = [0, 0, 0]  # Indexed by piece, boards[EMPTY] is unused
+        self.heights = [0] * COLS
+        self.moves = 0
+        self.key = 0  # Zobrist hash of the pieces on the board
+        self.turn = turn  # Piece to move
+        self.history = [0] * (ROWS * COLS)  # Undo stack: column of every move, self.moves deep
+        # Heuristic evaluation kept up to date by make_move() and unmake_move(), see score_position
+        self.window_states = [0] * len(WINDOW_MASKS)
+        self.scores = [0, EMPTY_BOARD_SCORE, EMPTY_BOARD_SCORE]
+
+    def copy(self):
+        position = Position.__new__(Position)
+        position.boards = self.boards[:]
+        position.heights = self.heights[:]
+        position.moves = self.moves
+        position.key = self.key
+        position.window_states = self.window_states[:]
+        position.scores = self.scores[:]
+        position.turn = self.turn
+        position.history = self.history[:]
+        return position
+
+    def can_play(self, col):
+        return self.heights[col] < ROWS
+
+    # Drop piece (by default the piece to move) in col
+    def make_move(self, col, piece=None):
+        if piece is None:
+            piece = self.turn
+        index = col * H1 + self.heights[col]
+        self.boards[piece] |= 1 << index
+        self.key ^= ZOBRIST[piece][index]
+        self.heights[col] += 1
+        self.history[self.moves] = col
+        self.moves += 1
+        self.turn = AI_PIECE if piece == PLAYER_PIECE else PLAYER_PIECE
+
+        # Only the windows through the new piece change their score
+        states = self.window_states
+        step = STATE_STEP[piece]
+        player_gain = WINDOW_GAINS[PLAYER_PIECE][piece]
+        ai_gain = WINDOW_GAINS[AI_PIECE][piece]
+        player_delta = ai_delta = 0
+        for w in CELL_WINDOWS[index]:
+            state = states[w]
+            player_delta += player_gain[state]
+            ai_delta += ai_gain[state]
+            states[w] = state + step
+        scores = self.scores
+        scores[PLAYER_PIECE] += player_delta
+        scores[AI_PIECE] += ai_delta
+        if index in CENTER_CELLS:
+            scores[piece] += 3
+
+    # Take back the last move, the exact reverse of make_move()
+    def unmake_move(self):
+        self.moves -= 1
+        col = self.history[self.moves]
+        self.heights[col] -= 1
+        index = col * H1 + self.heights[col]
+        piece = AI_PIECE if self.boards[AI_PIECE] >> index & 1 else PLAYER_PIECE
+        self.boards[piece] ^= 1 << index
+        self.key ^= ZOBRIST[piece][index]
+        self.turn = piece
+
+        states = self.window_states
+        step = STATE_STEP[piece]
+        player_gain = WINDOW_GAINS[PLAYER_PIECE][piece]
+        ai_gain = WINDOW_GAINS[AI_PIECE][piece]
+        player_delta = ai_delta = 0
+        for w in CELL_WINDOWS[index]:
+            state = states[w] - step
+            player_delta += player_gain[state]
+            ai_delta += ai_gain[state]
+            states[w] = state
+        scores = self.scores
+        scores[PLAYER_PIECE] -= player_delta
+        scores[AI_PIECE] -= ai_delta
+        if index in CENTER_CELLS:
+            scores[piece] -= 3
+
+    def piece_at(self, row, col):
+        bit = 1 << (col * H1 + row)
+        if self.boards[PLAYER_PIECE] & bit:
+            return PLAYER_PIECE
+        if self.boards[AI_PIECE] & bit:
+            return AI_PIECE
+        return EMPTY
+
+# Every WINDOW_LENGTH window of the board as a bitmask
+def _window_masks():
+    def cells_mask(cells):
+        return sum(1 << (c * H1 + r) for r, c in cells)
+
+    windows = []
+    # Horizontal
+    for r in range(ROWS):
+        for c in range(COLS - WINDOW_LENGTH + 1):
+            windows.append(cells_mask([(r, c + i) for i in range(WINDOW_LENGTH)]))
+    # Vertical
+    for c in range(COLS):
+        for r in range(ROWS - WINDOW_LENGTH + 1):
+            windows.append(cells_mask([(r + i, c) for i in range(WINDOW_LENGTH)]))
+    # Positive and negative sloped diagonals
+    for r in range(ROWS - WINDOW_LENGTH + 1):
+        for c in range(COLS - WINDOW_LENGTH + 1):
+            windows.append(cells_mask([(r + i, c + i) for i in range(WINDOW_LENGTH)]))
+            windows.append(cells_mask([(r + WINDOW_LENGTH - 1 - i, c + i) for i in range(WINDOW_LENGTH)]))
+    return windows
+
+WINDOW_MASKS = _window_masks()
+# For every cell index, the windows that contain it
+CELL_WINDOWS = [tuple(w for w, mask in enumerate(WINDOW_MASKS) if mask >> index & 1)
+                for index in range(COLS * H1)]
+# For every cell index, the masks of the windows that contain it
+CELL_WINDOW_MASKS = [tuple(WINDOW_MASKS[w] for w in windows) for windows in CELL_WINDOWS]
+CENTER_CELLS = frozenset(COLS // 2 * H1 + r for r in range(ROWS))
+
+# Function to create the game board, turn is the piece that moves first
+def create_board(turn=PLAYER_PIECE):
+    return Position(turn)
+
+# Board after playing moves (a list of columns) in order, first is the piece that
+# moved first. Used to send positions to other processes as a short list of ints.
+def position_from_moves(moves, first=PLAYER_PIECE):
+    board = Position(first)
+    for col in moves:
+        board.make_move(col)
+    return board
+
+# Moves that lead to board, the inverse of position_from_moves
+def moves_played(board):
+    return board.history[:board.moves]
+
+# The piece that made the first move on board
+def first_player(board):
+    if board.moves % 2 == 0:
+        return board.turn
+    return AI_PIECE if board.turn == PLAYER_PIECE else PLAYER_PIECE
+
+# Function to drop a piece in the board (row is always the next open row of col)
+def drop_piece(board, row, col, piece):
+    board.make_move(col, piece)
+
+# Check if the column is a valid location
+def is_valid_location(board, col):
+    return board.heights[col] < ROWS
+
+# Get the next open row in the chosen column
+def get_next_open_row(board, col):
+    if board.heights[col] < ROWS:
+        return board.heights[col]
+
+# Check if the piece has four in a row anywhere on the board
+def winning_move(board, piece):
+    bits = board.boards[piece]
+    for shift in WIN_SHIFTS:
+        # m keeps the cells that start a run of two, then of four, in this direction
+        m = bits & (bits >> shift)
+        if WINDOW_LENGTH == 4:
+            if m & (m >> (2 * shift)):
+                return True
+        else:
+            for i in range(2, WINDOW_LENGTH):
+                m &= bits >> (shift * i)
+            if m:
+                return True
+    return False
+
+# Whether the last move completed WINDOW_LENGTH in a row. Only the windows through the
+# piece it dropped can have been completed, so this tests a few masks where
+# winning_move scans the whole board. Positions from a game where nobody had won
+# before the last move, which is every position the search reaches, need no more.
+def last_move_won(board):
+    if not board.moves:
+        return False
+    col = board.history[board.moves - 1]
+    index = col * H1 + board.heights[col] - 1
+    bits = board.boards[AI_PIECE]
+    if not bits >> index & 1:
+        bits = board.boards[PLAYER_PIECE]
+    for mask in CELL_WINDOW_MASKS[index]:
+        if bits & mask == mask:
+            return True
+    return False
+
+# Empty cells where bits (the pieces of one side) would complete WINDOW_LENGTH in a
+# row, with mask holding the pieces of both sides. The cells that can be played now
+# are those in (mask + BOTTOM_MASK) & BOARD_MASK.
+def winning_cells(bits, mask):
+    if WINDOW_LENGTH == 4:
+        # Vertical
+        cells = (bits << 1) & (bits << 2) & (bits << 3)
+        # Horizontal and the two diagonals: the empty cell is at either end of three
+        # pieces or in a gap between them
+        for shift in (H1, H1 - 1, H1 + 1):
+            pair = (bits << shift) & (bits << 2 * shift)
+            cells |= pair & (bits << 3 * shift)
+            cells |= pair & (bits >> shift)
+            pair = (bits >> shift) & (bits >> 2 * shift)
+            cells |= pair & (bits << shift)
+            cells |= pair & (bits >> 3 * shift)
+    else:
+        cells = 0
+        for window in WINDOW_MASKS:
+            missing = window & ~bits
+            if missing and not missing & (missing - 1):
+                cells |= missing
+    return cells & (BOARD_MASK ^ mask)
+
+# First column in CENTER_ORDER with a cell in cells
+def _first_column(cells):
+    for col in CENTER_ORDER:
+        if cells & COLUMN_MASKS[col]:
+            return col
+    return None
+
+# Function to evaluate a window from the number of own and opponent pieces in it
+def evaluate_window(piece_count, opp_count):
+    score = 0
+    empty_count = WINDOW_LENGTH - piece_count - opp_count
+
+    if piece_count == 4:
+        score += 100
+    elif piece_count == 3 and empty_count == 1:
+        score += 5
+    elif piece_count == 2 and empty_count == 2:
+        score += 2
+
+    if opp_count == 3 and empty_count == 1:
+        score -= 4
+
+    return score
+
+# evaluate_window for every (own pieces, opponent pieces) pair, so scoring a window is a lookup
+WINDOW_SCORES = [[evaluate_window(own, opp) if own + opp <= WINDOW_LENGTH else 0
+                  for opp in range(WINDOW_LENGTH + 1)] for own in range(WINDOW_LENGTH + 1)]
+
+# Positions track every window as one state number, player pieces plus
+# (WINDOW_LENGTH + 1) * AI pieces, and keep a running score for both pieces.
+STATE_STEP = [0, 1, WINDOW_LENGTH + 1]  # Indexed by piece
+WINDOW_STATES = [(players, ais) for ais in range(WINDOW_LENGTH + 1) for players in range(WINDOW_LENGTH + 1)]
+STATE_SCORES = [
+    None,
+    [WINDOW_SCORES[players][ais] for players, ais in WINDOW_STATES],
+    [WINDOW_SCORES[ais][players] for players, ais in WINDOW_STATES],
+]
+# WINDOW_GAINS[scored piece][added piece][state]: score change when a piece is added to a window
+WINDOW_GAINS = [None] + [
+    [None] + [[STATE_SCORES[scored][state + STATE_STEP[added]] - STATE_SCORES[scored][state]
+               if state + STATE_STEP[added] < len(WINDOW_STATES) else 0
+               for state in range(len(WINDOW_STATES))]
+              for added in (PLAYER_PIECE, AI_PIECE)]
+    for scored in (PLAYER_PIECE, AI_PIECE)]
+EMPTY_BOARD_SCORE = len(WINDOW_MASKS) * WINDOW_SCORES[0][0]
+
+# Score the position of the board. The score is maintained incrementally as pieces
+# are played and taken back, so this is a lookup.
+def score_position(board, piece):
+    return board.scores[piece]
+
+# Score the position of the board from scratch, the reference for score_position
+def rescore_position(board, piece):
+    own = board.boards[piece]
+    opp = board.boards[PLAYER_PIECE if piece == AI_PIECE else AI_PIECE]
+
+    # Score center column
+    score = (own & CENTER_MASK).bit_count() * 3
+
+    # Score every horizontal, vertical and diagonal window
+    for window in WINDOW_MASKS:
+        score += WINDOW_SCORES[(own & window).bit_count()][(opp & window).bit_count()]
+
+    return score
+
+# Function to check if the game is over
+def is_terminal_node(board):
+    return winning_move(board, PLAYER_PIECE) or winning_move(board, AI_PIECE) or board.moves == ROWS * COLS
+
+# Get all valid locations
+def get_valid_locations(board):
+    return [col for col in range(COLS) if board.heights[col] < ROWS]
+# Bound types stored in the transposition table
+EXACT = 0
+LOWER = 1
+UPPER = 2
+TABLE_MAGIC = b"C4TABLE1"  # Header of TranspositionTable.save files, followed by the bucket count
+
+# Fixed-size transposition table. Entries live in flat typed arrays so the memory
+# budget is exact: every bucket has a depth-preferred slot and an always-replace slot.
+class TranspositionTable:
+    ENTRY_BYTES = 8 + 1 + 8 + 1 + 1  # key, depth, score, bound, move
+
+    def __init__(self, size_mb=16):
+        self.buckets = max(1, size_mb * 1024 * 1024 // (2 * self.ENTRY_BYTES))
+        size = 2 * self.buckets
+        self.keys = array("Q", bytes(8 * size))
+        self.depths = array("b", [-1]) * size  # -1 marks an empty slot
+        self.scores = array("d", bytes(8 * size))
+        self.bounds = array("b", bytes(size))
+        self.best_moves = array("b", [-1]) * size
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0
+
+    # Return (depth, score, bound, move) stored for key, or None
+    def probe(self, key):
+        slot = 2 * (key % self.buckets)
+        for i in (slot, slot + 1):
+            if self.depths[i] >= 0 and self.keys[i] == key:
+                self.hits += 1
+                move = self.best_moves[i]
+                return self.depths[i], self.scores[i], self.bounds[i], (None if move < 0 else move)
+        self.misses += 1
+        if self.depths[slot] >= 0 or self.depths[slot + 1] >= 0:
+            self.collisions += 1  # Bucket is taken by other positions
+        return None
+
+    def store(self, key, depth, score, bound, move):
+        slot = 2 * (key % self.buckets)
+        # Keep the deepest result in the first slot, everything else goes to the second
+        if self.keys[slot] != key and depth < self.depths[slot]:
+            slot += 1
+        self.keys[slot] = key
+        self.depths[slot] = depth
+        self.scores[slot] = score
+        self.bounds[slot] = bound
+        self.best_moves[slot] = -1 if move is None else move
+
+    def clear(self):
+        size = 2 * self.buckets
+        self.depths = array("b", [-1]) * size
+        self.hits = self.misses = self.collisions = 0
+
+    def hit_rate(self):
+        probes = self.hits + self.misses
+        return self.hits / probes if probes else 0.0
+
+    # Fraction of slots in use, to help choose size_mb
+    def usage(self):
+        return 1 - self.depths.count(-1) / len(self.depths)
+
+    # Write the entries to path, to load into a table of the same size later
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(TABLE_MAGIC + self.buckets.to_bytes(8, "little"))
+            for values in (self.keys, self.depths, self.scores, self.bounds, self.best_moves):
+                values.tofile(f)
+
+    # Replace the entries with those saved to path by a table of the same size
+    def load(self, path):
+        size = 2 * self.buckets
+        with open(path, "rb") as f:
+            header = f.read(len(TABLE_MAGIC) + 8)
+            if header != TABLE_MAGIC + self.buckets.to_bytes(8, "little"):
+                raise ValueError(f"{path} is not a saved table of this size")
+            for values in (self.keys, self.depths, self.scores, self.bounds, self.best_moves):
+                del values[:]
+                values.fromfile(f, size)
+        self.hits = self.misses = self.collisions = 0
+# Raised inside minimax when the time budget of a Search runs out
+class SearchTimeout(Exception):
+    pass
+
+# Per-move search state: the deadline plus the killer and history move ordering
+# heuristics, which carry over from one deepening iteration to the next. stats (a
+# search_stats.SearchStats) is filled in by minimax when given. Setting stop (a
+# threading.Event) cancels the search like running out of time.
+class Search:
+    def __init__(self, table=None, budget_ms=None, stats=None, stop=None):
+        self.table = table
+        self.stats = stats
+        self.stop = stop
+        self.deadline = None if budget_ms is None else time.perf_counter() + budget_ms / 1000
+        self.nodes = 0
+        self.pv_move = None  # Best root move of the last finished iteration
+        self.root_moves = None
+        self.killers = [[None, None] for _ in range(ROWS * COLS + 1)]  # Indexed by pieces on the board
+        self.history = [[0] * COLS for _ in range(3)]  # Indexed by piece and column
+
+    def check_time(self):
+        self.nodes += 1
+        if not self.nodes & 255:
+            if self.deadline is not None and time.perf_counter() > self.deadline:
+                raise SearchTimeout
+            if self.stop is not None and self.stop.is_set():
+                raise SearchTimeout
+
+    def cutoff(self, board, col, piece, depth):
+        killers = self.killers[board.moves]
+        if killers[0] != col:
+            killers[1] = killers[0]
+            killers[0] = col
+        self.history[piece][col] += depth * depth
+
+# Valid columns in search order: hash move, then killers, then history score with
+# ties broken center-first
+def order_moves(board, piece, hash_move, search):
+    moves = [col for col in CENTER_ORDER if board.heights[col] < ROWS]
+    if search is not None:
+        moves.sort(key=search.history[piece].__getitem__, reverse=True)
+        for killer in reversed(search.killers[board.moves]):
+            if killer is not None and killer != hash_move and killer in moves:
+                moves.remove(killer)
+                moves.insert(0, killer)
+        if board.moves == search.root_moves and search.pv_move is not None:
+            hash_move = search.pv_move
+    if hash_move is not None and hash_move in moves:
+        moves.remove(hash_move)
+        moves.insert(0, hash_move)
+    return moves
+
+# Tactics that need no search, for piece to move: a move that wins now, a threat of
+# the opponent that must be blocked, two threats that can't both be blocked, and
+# moves right below an opponent's winning cell, which hand it over. Returns (column,
+# value, safe): column and value (from the AI's point of view) when the position is
+# decided, otherwise None, None and the playable cells that don't lose at once, or
+# None for safe when that's all of them. The checks on the opponent's threats are
+# skipped unless replies is true, since they are only exact when the search would
+# look at the reply anyway.
+def tactics(board, piece, replies=True):
+    mask = board.boards[PLAYER_PIECE] | board.boards[AI_PIECE]
+    playable = (mask + BOTTOM_MASK) & BOARD_MASK
+    win = math.inf if piece == AI_PIECE else -math.inf
+    wins = winning_cells(board.boards[piece], mask) & playable
+    if wins:
+        return _first_column(wins), win, wins
+    if not replies:
+        return None, None, None
+    threats = winning_cells(board.boards[AI_PIECE if piece == PLAYER_PIECE else PLAYER_PIECE], mask)
+    safe = playable
+    blocks = threats & playable
+    if blocks:
+        if blocks & (blocks - 1):
+            return _first_column(blocks), -win, 0  # Two threats: the opponent wins next move
+        safe = blocks
+    safe &= ~(threats >> 1)
+    if not safe:
+        return _first_column(playable), -win, 0
+    return None, None, (None if safe == playable else safe)
+
+# Minimax algorithm with Alpha-Beta pruning. Results are cached in table (a
+# TranspositionTable) when one is given, so transpositions are only searched once.
+# search (a Search) adds move ordering heuristics and a time limit.
+def minimax(board, depth, alpha, beta, maximizingPlayer, table=None, search=None):
+    stats = None
+    if search is not None:
+        search.check_time()
+        stats = search.stats
+        if stats is not None:
+            stats.node(board.moves)
+    # Only the last move can have ended the game
+    won = last_move_won(board)
+    if won or board.moves == ROWS * COLS:
+        if stats is not None:
+            stats.terminal_hits += 1
+        if not won:
+            return (None, 0)
+        return (None, -math.inf if board.turn == AI_PIECE else math.inf)
+    if depth == 0:
+        if stats is not None:
+            stats.evaluations += 1
+        return (None, score_position(board, AI_PIECE))
+
+    piece = AI_PIECE if maximizingPlayer else PLAYER_PIECE
+    hash_move = None
+    if table is not None:
+        key = board.key ^ ZOBRIST_AI_TO_MOVE if maximizingPlayer else board.key
+        alpha_orig, beta_orig = alpha, beta
+        entry = table.probe(key)
+        if entry is not None:
+            entry_depth, entry_score, bound, hash_move = entry
+            if entry_depth >= depth:
+                if bound == EXACT:
+                    return hash_move, entry_score
+                elif bound == LOWER:
+                    alpha = max(alpha, entry_score)
+                else:
+                    beta = min(beta, entry_score)
+                if alpha >= beta:
+                    return hash_move, entry_score
+
+    # A depth 1 search finds wins as quickly by itself
+    safe = None
+    if depth >= 2:
+        column, value, safe = tactics(board, piece)
+        if column is not None:
+            return column, value
+
+    valid_locations = order_moves(board, piece, hash_move, search)
+    if safe is not None:
+        valid_locations = [col for col in valid_locations if safe & COLUMN_MASKS[col]]
+    column = valid_locations[0]
+    if maximizingPlayer:
+        value = -math.inf
+        for col in valid_locations:
+            board.make_move(col, AI_PIECE)
+            new_score = minimax(board, depth-1, alpha, beta, False, table, search)[1]
+            board.unmake_move()
+            if new_score > value:
+                value = new_score
+                column = col
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                if search is not None:
+                    search.cutoff(board, col, piece, depth)
+                    if stats is not None:
+                        stats.cutoff(col == valid_locations[0])
+                break
+
+    else:  # Minimizing player
+        value = math.inf
+        for col in valid_locations:
+            board.make_move(col, PLAYER_PIECE)
+            new_score = minimax(board, depth-1, alpha, beta, True, table, search)[1]
+            board.unmake_move()
+            if new_score < value:
+                value = new_score
+                column = col
+            beta = min(beta, value)
+            if alpha >= beta:
+                if search is not None:
+                    search.cutoff(board, col, piece, depth)
+                    if stats is not None:
+                        stats.cutoff(col == valid_locations[0])
+                break
+
+    if table is not None:
+        if value <= alpha_orig:
+            bound = UPPER
+        elif value >= beta_orig:
+            bound = LOWER
+        else:
+            bound = EXACT
+        table.store(key, depth, value, bound, column)
+    return column, value
+
+# Iterative deepening for the piece to move: search depth 1, 2, 3, ... until budget_ms
+# runs out and play the best move of the deepest finished iteration. An unfinished
+# iteration is thrown away, but everything it stored in the table speeds up the next
+# move. Values are from the AI's point of view. Returns (column, value, depth), and
+# fills in stats (a search_stats.SearchStats) when one is given. budget_ms None
+# searches until stop (a threading.Event) is set or the game is solved. Positions in
+# book (a connect4_book.OpeningBook) are answered from it without searching.
+def iterative_deepening(board, budget_ms, table=None, stats=None, stop=None, book=None):
+    if book is not None:
+        entry = book.probe(board)
+        if entry is not None:
+            if stats is not None:
+                stats.finish(*entry)
+            return entry
+    if table is None:
+        table = TranspositionTable()
+    search = Search(table, budget_ms, stats, stop)
+    search.root_moves = board.moves
+    maximizing = board.turn == AI_PIECE
+    # A win, a loss that can't be avoided or a single move that doesn't lose at once
+    # is played without spending the budget
+    column, value, safe = tactics(board, board.turn)
+    depth = 1
+    if column is None and safe is not None and not safe & (safe - 1):
+        depth = 2  # Search the forced move just deep enough for its value
+        column, value = minimax(board, depth, -math.inf, math.inf, maximizing, table, search)
+    if column is not None:
+        if stats is not None:
+            stats.finish(column, value, depth)
+        return column, value, depth
+    column, value, depth = order_moves(board, board.turn, None, None)[0], 0, 0
+    for d in range(1, ROWS * COLS - board.moves + 1):
+        if stats is not None:
+            stats.start_iteration(d)
+        try:
+            col, val = minimax(board, d, -math.inf, math.inf, maximizing, table, search)
+        except SearchTimeout:
+            # Take back the moves the interrupted search left on the board
+            while board.moves > search.root_moves:
+                board.unmake_move()
+            if stats is not None:
+                stats.end_iteration(False)
+            break
+        if stats is not None:
+            stats.end_iteration()
+        column, value, depth = col, val, d
+        search.pv_move = col
+        if val == math.inf or val == -math.inf:
+            break  # Won or lost for sure, searching deeper can't change the move
+    if stats is not None:
+        stats.finish(column, value, depth)
+    return column, value, depth
+
+# Best column for the piece to move in position, searched for budget_ms milliseconds.
+# Pass the same table on every call to reuse the work of earlier moves.
+def best_move(position, budget_ms, table=None, stats=None, stop=None, book=None):
+    return iterative_deepening(position, budget_ms, table, stats, stop, book)[0]
+
+# The column the piece to move is most likely to play: the table's best move for the
+# position, which the last search stored for its expected reply. Used to ponder,
+# searching that reply during the opponent's turn so the table already holds most of
+# the next search when it's played.
+def predicted_move(board, table):
+    key = board.key ^ ZOBRIST_AI_TO_MOVE if board.turn == AI_PIECE else board.key
+    entry = table.probe(key)
+    if entry is not None and entry[3] is not None and board.can_play(entry[3]):
+        return entry[3]
+    return order_moves(board, board.turn, None, None)[0]
+
+# The expected line of play from board: the table's best move of each position in
+# turn, for up to length moves
+def principal_variation(board, table, length):
+    pv = []
+    while len(pv) < length and board.moves < ROWS * COLS and not (pv and last_move_won(board)):
+        key = board.key ^ ZOBRIST_AI_TO_MOVE if board.turn == AI_PIECE else board.key
+        entry = table.probe(key)
+        if entry is None or entry[3] is None or not board.can_play(entry[3]):
+            break
+        pv.append(entry[3])
+        board.make_move(entry[3])
+    for _ in pv:
+        board.unmake_move()
+    return pv
+
+# One iteration of analyze: the line of every column searched to depth, best first
+def _analyze_iteration(board, depth, columns, top_k, table, search):
+    maximizing = board.turn == AI_PIECE
+    sign = 1 if maximizing else -1
+    lines = []
+    exact = []  # Values of the moves searched exactly, for the piece to move
+    for col in columns:
+        # Past top_k moves, only a move better than the top_k-th best needs its value
+        threshold = -math.inf
+        if top_k is not None and len(exact) >= top_k:
+            threshold = sorted(exact, reverse=True)[top_k - 1]
+        if threshold == math.inf:
+            # top_k moves win already, so none can be better
+            lines.append((col, sign * math.inf, UPPER if maximizing else LOWER))
+            continue
+        board.make_move(col)
+        if maximizing:
+            value = minimax(board, depth - 1, threshold, math.inf, False, table, search)[1]
+        else:
+            value = minimax(board, depth - 1, -math.inf, -threshold, True, table, search)[1]
+        board.unmake_move()
+        if threshold == -math.inf or sign * value > threshold:
+            exact.append(sign * value)
+            lines.append((col, value, EXACT))
+        else:
+            lines.append((col, value, UPPER if maximizing else LOWER))
+    lines.sort(key=lambda line: (line[2] != EXACT, -sign * line[1]))
+    return lines
+
+# Multi-PV analysis for the piece to move: the value of every legal move from one
+# search, deepened like iterative_deepening, with the moves sharing table and the
+# move ordering heuristics. Returns (lines, pv, depth): lines are (column, value,
+# bound), best first for the piece to move, with values from the AI's point of view.
+# bound is EXACT, unless top_k is given: then only the top_k best moves are searched
+# exactly, and the others only far enough to show they are no better, giving an
+# UPPER (LOWER when the player is to move) bound for far fewer nodes. pv is the
+# expected line of play, starting with the best move. depth alone searches that
+# depth at once; with budget_ms or stop (as in iterative_deepening) the search
+# deepens and the lines are those of the deepest finished iteration.
+def analyze(board, budget_ms=None, depth=None, top_k=None, table=None, stats=None, stop=None):
+    if top_k is not None and top_k < 1:
+        raise ValueError("top_k is at least 1")
+    if table is None:
+        table = TranspositionTable()
+    search = Search(table, budget_ms, stats, stop)
+    search.root_moves = board.moves
+    columns = order_moves(board, board.turn, None, None)
+    lines, completed = [], 0
+    last = ROWS * COLS - board.moves if depth is None else min(depth, ROWS * COLS - board.moves)
+    # Deepening pays for itself when the search may stop early, not for a fixed depth
+    first = last if depth is not None and budget_ms is None and stop is None else 1
+    for d in range(max(first, 1), last + 1):
+        if stats is not None:
+            stats.start_iteration(d)
+        try:
+            # Depth 1 is too quick to time out, so there are always lines to return
+            iteration = _analyze_iteration(board, d, columns, top_k, table, search if d > 1 else None)
+        except SearchTimeout:
+            while board.moves > search.root_moves:
+                board.unmake_move()
+            if stats is not None:
+                stats.end_iteration(False)
+            break
+        if stats is not None:
+            stats.end_iteration()
+        lines, completed = iteration, d
+        columns = [col for col, _, _ in lines]  # The next iteration searches the best moves first
+        if all(bound == EXACT and value in (math.inf, -math.inf) for _, value, bound in lines):
+            break  # Every move wins or loses for sure
+    if not lines:
+        return lines, [], completed
+    board.make_move(lines[0][0])
+    pv = [lines[0][0]] + principal_variation(board, table, completed - 1)
+    board.unmake_move()
+    if stats is not None:
+        stats.finish(lines[0][0], lines[0][1], completed)
+    return lines, pv, completed
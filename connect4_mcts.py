@@ -0,0 +1,411 @@
+# Monte Carlo tree search (UCT) for Connect4: an alternative to the minimax engine that
+# needs no evaluation function, so its strength doesn't depend on the score_position
+# weights and it keeps improving with time on boards too large to search deeply.
+#
+#   python connect4_mcts.py --ms 1000 --workers 4    search the empty board, report
+#                                                    playouts per second
+#
+# The tree is stored in parallel arrays (Tree), one entry per node: its parent, its
+# first child (children of a node are stored next to each other), the move leading to
+# it, and its visit count and summed result. Results are from the point of view of the
+# piece that made the node's move: 1 for a win, 0.5 for a draw. Every iteration walks
+# down the tree by UCT, expands the leaf it reaches on its first visit, and scores it
+# with a batch of BATCH random playouts run together in NumPy on uint64 bitboards (one
+# element per playout), so there is no Python code per playout move.
+#
+# With workers, a process pool either grows one tree each from the same position and
+# adds up their root statistics (root parallelism), or runs the playouts of several
+# leaves at once for one tree, the leaves picked with virtual losses so they differ
+# (leaf parallelism). Between moves the subtree of the position reached is kept, so
+# the next search starts with what it learned about it.
+#
+# The tree uses winning_move and get_valid_locations of connect4_engine, and the
+# playouts the same bitboard layout. NumPy is only needed by this module.
+import argparse
+import math
+import os
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor, wait
+
+import numpy as np
+
+from connect4_engine import (AI_PIECE, BOARD_MASK, BOTTOM_MASK, COLS, H1, ROWS, WIN_SHIFTS, WINDOW_LENGTH,
+                             first_player, get_valid_locations, moves_played, position_from_moves, winning_move)
+
+CELLS = ROWS * COLS
+EXPLORATION = math.sqrt(2)
+BATCH = 64  # Playouts per leaf
+MAX_NODES = 2000000  # Leaves aren't expanded beyond this many nodes
+COLUMN_MASKS = np.array([((1 << ROWS) - 1) << (c * H1) for c in range(COLS)], dtype=np.uint64)
+_BOTTOM = np.uint64(BOTTOM_MASK)
+_BOARD = np.uint64(BOARD_MASK)
+_SHIFTS = np.array(WIN_SHIFTS, dtype=np.uint64)[:, None]  # One row per direction
+
+
+# Which of the bitboards have WINDOW_LENGTH in a row, all directions at once
+def _wins(bits):
+    if WINDOW_LENGTH == 4:
+        m = bits & (bits >> _SHIFTS)
+        return (m & (m >> (_SHIFTS + _SHIFTS))).any(axis=0)
+    m = bits & (bits >> _SHIFTS)
+    for i in range(2, WINDOW_LENGTH):
+        m &= bits >> (_SHIFTS * np.uint64(i))
+    return m.any(axis=0)
+
+
+# count random playouts from the position where the side to move has the pieces
+# current, mask has all pieces and moves have been played. Returns (wins, losses) of
+# the side to move; the rest are draws.
+def playouts(current, mask, moves, count, rng):
+    if COLS * H1 > 64:
+        raise ValueError("playouts need the board to fit in 64 bits")
+    current = np.full(count, current, dtype=np.uint64)
+    mask = np.full(count, mask, dtype=np.uint64)
+    wins = losses = 0
+    mover_wins = True  # Whether the piece moving now is the side to move at the start
+    noise = rng.random((CELLS - moves, count, COLS))
+    for ply in range(CELLS - moves):
+        possible = (mask + _BOTTOM) & _BOARD
+        open_columns = (possible[:, None] & COLUMN_MASKS) != 0
+        # A uniformly random open column for every playout
+        col = (noise[ply, :len(mask)] * open_columns).argmax(axis=1)
+        move = possible & COLUMN_MASKS[col]
+        current |= move
+        mask |= move
+        won = _wins(current)
+        finished = np.count_nonzero(won)
+        if finished:
+            if mover_wins:
+                wins += finished
+            else:
+                losses += finished
+            going = ~won
+            current, mask = current[going], mask[going]
+            if not len(mask):
+                break
+        current ^= mask  # The opponent's pieces, who moves next
+        mover_wins = not mover_wins
+    return wins, losses
+
+
+class Tree:
+    __slots__ = ("parent", "first_child", "child_count", "move", "visits", "wins")
+
+    def __init__(self):
+        self.parent = array("i")
+        self.first_child = array("i")  # -1 until expanded
+        self.child_count = array("b")
+        self.move = array("b")
+        self.visits = array("d")  # Leaf batches through the node
+        self.wins = array("d")  # Summed results of those batches for the node's mover
+        self.add(-1, -1)
+
+    def __len__(self):
+        return len(self.parent)
+
+    def add(self, parent, move):
+        self.parent.append(parent)
+        self.first_child.append(-1)
+        self.child_count.append(0)
+        self.move.append(move)
+        self.visits.append(0.0)
+        self.wins.append(0.0)
+        return len(self.parent) - 1
+
+    # Give node the children for columns
+    def expand(self, node, columns):
+        self.first_child[node] = len(self.parent)
+        self.child_count[node] = len(columns)
+        for col in columns:
+            self.add(node, col)
+
+    def children(self, node):
+        first = self.first_child[node]
+        return range(first, first + self.child_count[node]) if first >= 0 else range(0)
+
+    # The child of node for col, or None when it isn't in the tree
+    def child(self, node, col):
+        for child in self.children(node):
+            if self.move[child] == col:
+                return child
+        return None
+
+    # A new tree holding the subtree below node, node becoming the root
+    def subtree(self, node):
+        tree = Tree()
+        tree.visits[0] = self.visits[node]
+        tree.wins[0] = self.wins[node]
+        pending = [(node, 0)]
+        for old, new in pending:
+            if self.first_child[old] < 0:
+                continue
+            tree.first_child[new] = len(tree)
+            tree.child_count[new] = self.child_count[old]
+            for child in self.children(old):
+                copy = tree.add(new, self.move[child])
+                tree.visits[copy] = self.visits[child]
+                tree.wins[copy] = self.wins[child]
+                pending.append((child, copy))
+        return tree
+
+
+# Random generator and tree of a worker process, created by _init_worker
+_rng = None
+_mcts = None
+
+def _init_worker(batch, exploration):
+    global _rng, _mcts
+    _rng = np.random.default_rng()
+    _mcts = MCTS(batch=batch, exploration=exploration)
+
+def _ready():
+    return os.getpid()
+
+# Worker task for leaf parallelism: playouts() of one leaf
+def _leaf_playouts(current, mask, moves, count):
+    return playouts(current, mask, moves, count, _rng)
+
+# Worker task for root parallelism: search the position given by moves with the
+# worker's own tree and return its root statistics, {column: (visits, wins)}, with
+# the number of playouts and iterations
+def _root_search(moves, first, budget_ms, iterations):
+    board = position_from_moves(moves, first)
+    _mcts.search(board, budget_ms, iterations)
+    tree = _mcts.tree
+    root = {tree.move[child]: (tree.visits[child], tree.wins[child]) for child in tree.children(0)}
+    return root, _mcts.playouts, _mcts.iterations
+
+
+class MCTS:
+    def __init__(self, workers=1, parallel="root", batch=BATCH, exploration=EXPLORATION, seed=None):
+        if parallel not in ("root", "leaf"):
+            raise ValueError("parallel is 'root' or 'leaf'")
+        self.workers = workers
+        self.parallel = parallel
+        self.batch = batch
+        self.exploration = exploration
+        self.rng = np.random.default_rng(seed)
+        self.tree = Tree()
+        self.root_moves = None  # (first player, moves) of the root of self.tree
+        self.playouts = 0  # Playouts, iterations and seconds of the last search
+        self.iterations = 0
+        self.seconds = 0.0
+        self.max_depth = 0
+        self.pool = None
+        if workers > 1:
+            self.pool = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(batch, exploration))
+            # Start every worker now instead of on the first move
+            wait([self.pool.submit(_ready) for _ in range(workers)])
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    # Make the tree's root board, keeping the subtree of the last search's tree that
+    # board was reached in when there is one
+    def _set_root(self, board):
+        first, moves = first_player(board), moves_played(board)
+        node = None
+        if self.root_moves is not None and self.root_moves[0] == first:
+            old = self.root_moves[1]
+            if moves[:len(old)] == old:
+                node = 0
+                for col in moves[len(old):]:
+                    node = self.tree.child(node, col)
+                    if node is None:
+                        break
+        if node is None:
+            self.tree = Tree()
+        elif node != 0:
+            self.tree = self.tree.subtree(node)
+        self.root_moves = (first, moves)
+
+    # The child of node with the highest UCT value; unvisited children come first
+    def _select(self, node):
+        tree = self.tree
+        visits, wins = tree.visits, tree.wins
+        log_visits = math.log(visits[node]) if visits[node] > 0 else 0.0
+        best, best_value = -1, -math.inf
+        for child in tree.children(node):
+            n = visits[child]
+            if n == 0:
+                return child
+            value = wins[child] / n + self.exploration * math.sqrt(log_visits / n)
+            if value > best_value:
+                best, best_value = child, value
+        return best
+
+    # Walk down from the root to a leaf, making the moves on board. Returns (leaf,
+    # result for its mover or None when it isn't over, depth).
+    def _descend(self, board):
+        tree = self.tree
+        node = 0
+        depth = 0
+        while tree.first_child[node] >= 0:
+            node = self._select(node)
+            piece = board.turn
+            board.make_move(tree.move[node])
+            depth += 1
+            if winning_move(board, piece):
+                return node, 1.0, depth
+            if board.moves == CELLS:
+                return node, 0.5, depth
+        if tree.visits[node] == 0 and node != 0:
+            return node, None, depth  # Expanded on the next visit
+        if len(tree) < MAX_NODES:
+            tree.expand(node, get_valid_locations(board))
+        return node, None, depth
+
+    # Add result (for the mover of node) of one batch to node and its ancestors
+    def _backup(self, node, result):
+        tree = self.tree
+        while node >= 0:
+            tree.visits[node] += 1.0
+            tree.wins[node] += result
+            result = 1.0 - result
+            node = tree.parent[node]
+
+    # Add a visit without a win for anyone to node and its ancestors (or take it back
+    # with amount -1), so they look worse until the leaf's playouts are in
+    def _virtual_loss(self, node, amount):
+        tree = self.tree
+        while node >= 0:
+            tree.visits[node] += amount
+            node = tree.parent[node]
+
+    # Result for the mover of the leaf from the (wins, losses) of the side to move
+    def _leaf_result(self, wins, losses):
+        draws = self.batch - wins - losses
+        return (losses + 0.5 * draws) / self.batch
+
+    def _iterate(self, board):
+        node, result, depth = self._descend(board)
+        if result is None:
+            current = board.boards[board.turn]
+            mask = board.boards[1] | board.boards[2]
+            result = self._leaf_result(*playouts(current, mask, board.moves, self.batch, self.rng))
+            self.playouts += self.batch
+        self._backup(node, result)
+        self.max_depth = max(self.max_depth, depth)
+        for _ in range(depth):
+            board.unmake_move()
+
+    # One round of leaf parallelism: a leaf per worker, picked with a virtual loss on
+    # the path to every leaf so the next one goes elsewhere, then played out together.
+    # Returns the number of leaves.
+    def _iterate_leaves(self, board):
+        leaves = []
+        for _ in range(self.workers):
+            node, result, depth = self._descend(board)
+            self.max_depth = max(self.max_depth, depth)
+            if result is None:
+                current = board.boards[board.turn]
+                mask = board.boards[1] | board.boards[2]
+                leaves.append((node, self.pool.submit(_leaf_playouts, current, mask, board.moves, self.batch)))
+                self._virtual_loss(node, 1.0)
+            else:
+                self._backup(node, result)
+            for _ in range(depth):
+                board.unmake_move()
+        for node, future in leaves:
+            self._virtual_loss(node, -1.0)
+            self._backup(node, self._leaf_result(*future.result()))
+            self.playouts += self.batch
+        return self.workers
+
+    # (column, expected result for the piece to move) of board after searching for
+    # budget_ms milliseconds or iterations leaf batches, whichever comes first, or
+    # until stop (a threading.Event) is set; with root parallelism the workers only
+    # stop at the budget. The most visited move is played. stats (a
+    # search_stats.SearchStats) gets the iterations as nodes and the playouts as
+    # evaluations.
+    def search(self, board, budget_ms=None, iterations=None, stop=None, stats=None):
+        if budget_ms is None and iterations is None and stop is None:
+            raise ValueError("give a time budget, an iteration count or a stop event")
+        start = time.perf_counter()
+        deadline = None if budget_ms is None else start + budget_ms / 1000
+        self.playouts = self.iterations = self.max_depth = 0
+        self._set_root(board)
+
+        if self.pool is not None and self.parallel == "root":
+            col, value = self._search_root_parallel(board, budget_ms, iterations)
+        else:
+            position = board.copy()
+            while iterations is None or self.iterations < iterations:
+                if deadline is not None and time.perf_counter() >= deadline:
+                    break
+                if stop is not None and stop.is_set():
+                    break
+                if self.pool is not None:
+                    self.iterations += self._iterate_leaves(position)
+                else:
+                    self._iterate(position)
+                    self.iterations += 1
+            col, value = self._best_child()
+
+        self.seconds = time.perf_counter() - start
+        if stats is not None:
+            stats.nodes += self.iterations
+            stats.evaluations += self.playouts
+            stats.root = board.moves
+            stats.max_ply = board.moves + self.max_depth
+            stats.finish(col, value, self.max_depth)
+        return col, value
+
+    def _best_child(self):
+        tree = self.tree
+        children = tree.children(0)
+        if not len(children):
+            board = position_from_moves(self.root_moves[1], self.root_moves[0])
+            return get_valid_locations(board)[0], 0.5
+        best = max(children, key=lambda child: tree.visits[child])
+        return tree.move[best], tree.wins[best] / tree.visits[best] if tree.visits[best] else 0.5
+
+    def _search_root_parallel(self, board, budget_ms, iterations):
+        moves, first = moves_played(board), first_player(board)
+        futures = [self.pool.submit(_root_search, moves, first, budget_ms, iterations) for _ in range(self.workers)]
+        totals = {}
+        for future in futures:
+            root, playouts_done, iterations_done = future.result()
+            self.playouts += playouts_done
+            self.iterations += iterations_done
+            for col, (visits, wins) in root.items():
+                old = totals.get(col, (0.0, 0.0))
+                totals[col] = (old[0] + visits, old[1] + wins)
+        if not totals:
+            return get_valid_locations(board)[0], 0.5
+        col = max(totals, key=lambda c: totals[c][0])
+        visits, wins = totals[col]
+        return col, wins / visits if visits else 0.5
+
+    def playouts_per_second(self):
+        return self.playouts / self.seconds if self.seconds else 0.0
+
+
+# Column for the piece to move in position, searched by mcts (an MCTS kept for the
+# whole game, so its tree carries over) for budget_ms milliseconds
+def best_move(position, budget_ms, mcts, stats=None, stop=None):
+    return mcts.search(position, budget_ms, stop=stop, stats=stats)[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search the empty Connect4 board with MCTS")
+    parser.add_argument("--ms", type=int, default=1000, help="time budget per search")
+    parser.add_argument("--iterations", type=int, help="leaf batches per search instead of a time budget")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--parallel", choices=("root", "leaf"), default="root")
+    parser.add_argument("--batch", type=int, default=BATCH, help="playouts per leaf")
+    args = parser.parse_args()
+    mcts = MCTS(args.workers, args.parallel, args.batch, seed=0)
+    board = position_from_moves([], AI_PIECE)
+    budget_ms = None if args.iterations else args.ms
+    col, value = mcts.search(board, budget_ms, args.iterations)
+    print(f"{ROWS}x{COLS} empty board: column {col}, expected result {value:.3f}; {mcts.playouts} playouts, "
+          f"{mcts.iterations} iterations in {mcts.seconds:.2f} s, {mcts.playouts_per_second():,.0f} playouts/s")
+    mcts.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+# Parallel Connect4 search: the root moves are split across a process pool, each
+# worker searching whole subtrees with its own transposition table. The first
+# (most promising) root move is searched alone, and its value bounds the search
+# of the other root moves, which then run in parallel. The pool is
+# created once and kept for the whole game, so a move doesn't pay for starting
+# processes, and the worker tables keep their contents between moves.
+import math
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+
+from connect4_engine import (AI_PIECE, ROWS, COLS, COLUMN_MASKS, Search, SearchTimeout, TranspositionTable,
+                             first_player, minimax, moves_played, order_moves, position_from_moves, tactics)
+from search_stats import SearchStats
+
+# Transposition table of the worker process, created by _init_worker, and the event
+# that stops its searches when a search is cancelled
+_table = None
+_cancelled = None
+
+def _init_worker(table_mb, cancelled):
+    global _table, _cancelled
+    _table = TranspositionTable(table_mb)
+    _cancelled = cancelled
+
+def _ready():
+    return os.getpid()
+
+# Worker task: value of playing col in the position given by moves, searched to depth
+# more plies within (alpha, beta). The value is None if the wall-clock deadline passes
+# or the search is cancelled first. fresh_table clears the worker table so results don't depend on what the
+# worker searched before. Returns (value, SearchStats.as_dict() or None).
+def _search_root_move(moves, first, col, depth, alpha, beta, deadline, fresh_table, with_stats=False):
+    board = position_from_moves(moves, first)
+    maximizing = board.turn != AI_PIECE  # The opponent moves after col
+    board.make_move(col)
+    if fresh_table:
+        _table.clear()
+    budget_ms = None if deadline is None else max(0.0, (deadline - time.time()) * 1000)
+    stats = SearchStats() if with_stats else None
+    try:
+        search = Search(_table, budget_ms, stats, _cancelled)
+        value = minimax(board, depth, alpha, beta, maximizing, _table, search)[1]
+    except SearchTimeout:
+        value = None
+    return value, None if stats is None else stats.as_dict()
+
+class ParallelSearch:
+    def __init__(self, workers=None, table_mb=16):
+        self.workers = workers or os.cpu_count() or 1
+        self.cancelled = multiprocessing.Event()
+        self.pool = ProcessPoolExecutor(self.workers, initializer=_init_worker, initargs=(table_mb, self.cancelled))
+        # Start every worker now instead of on the first move
+        wait([self.pool.submit(_ready) for _ in range(self.workers)])
+
+    # Wait for futures. If stop (a threading.Event) is set first, the futures not started
+    # yet are cancelled, the running ones are stopped, and the result is False.
+    def _finish(self, futures, stop):
+        if stop is None:
+            wait(futures)
+            return True
+        pending = futures
+        while pending:
+            if stop.is_set():
+                for future in pending:
+                    future.cancel()
+                # The workers check the event every few hundred nodes, so this is quick.
+                # It's cleared once they're done, before the next search can start.
+                self.cancelled.set()
+                wait(pending)
+                self.cancelled.clear()
+                return False
+            pending = wait(pending, timeout=0.01).not_done
+        return True
+
+    # Values of every root move of board at depth plies (a move plus depth - 1 replies),
+    # in the order the serial search tries them. The first value is exact; the others
+    # are exact only when they beat it, which is all _pick needs. None means timed out
+    # or cancelled by stop. The workers' counters are added to stats when it is given.
+    # Like minimax, from depth 2 the root's tactics settle it or leave out the moves
+    # that lose at once.
+    def _root_values(self, board, depth, deadline=None, fresh_table=False, stats=None, stop=None):
+        moves = moves_played(board)
+        first = first_player(board)
+        columns = order_moves(board, board.turn, None, None)
+        if depth >= 2:
+            column, value, safe = tactics(board, board.turn)
+            if column is not None:
+                return [column], [value]
+            if safe is not None:
+                columns = [col for col in columns if safe & COLUMN_MASKS[col]]
+        with_stats = stats is not None
+        future = self.pool.submit(_search_root_move, moves, first, columns[0], depth - 1,
+                                  -math.inf, math.inf, deadline, fresh_table, with_stats)
+        if not self._finish([future], stop):
+            return columns, [None] * len(columns)
+        value, data = future.result()
+        results = [(value, data)]
+        if value is not None:
+            alpha, beta = (value, math.inf) if board.turn == AI_PIECE else (-math.inf, value)
+            futures = [self.pool.submit(_search_root_move, moves, first, col, depth - 1, alpha, beta, deadline,
+                                        fresh_table, with_stats)
+                       for col in columns[1:]]
+            if not self._finish(futures, stop):
+                return columns, [None] * len(columns)
+            results += [future.result() for future in futures]
+        if with_stats:
+            for _, data in results:
+                stats.merge(data, 1)  # The workers start below the root move
+        return columns, [value for value, _ in results]
+
+    @staticmethod
+    def _pick(board, columns, values):
+        # First best column in search order, the same tie-break as the serial minimax
+        maximizing = board.turn == AI_PIECE
+        best = max(values) if maximizing else min(values)
+        return columns[values.index(best)], best
+
+    # Fixed-depth search of board for the piece to move. Gives the same (column, value)
+    # as minimax(board, depth, -inf, inf, maximizing) on a single core.
+    def search(self, board, depth):
+        columns, values = self._root_values(board, depth, fresh_table=True)
+        return self._pick(board, columns, values)
+
+    # Iterative deepening in parallel with a wall-clock budget, see
+    # connect4_engine.iterative_deepening. Setting stop (a threading.Event) cancels the
+    # search, which then returns the best move of the last finished iteration. Returns
+    # (column, value, depth).
+    def iterative_deepening(self, board, budget_ms, stats=None, book=None, stop=None):
+        if book is not None:
+            entry = book.probe(board)
+            if entry is not None:
+                if stats is not None:
+                    stats.finish(*entry)
+                return entry
+        deadline = time.time() + budget_ms / 1000
+        # Decided positions and forced moves are answered at once, as in the serial search
+        column, value, safe = tactics(board, board.turn)
+        depth = 1
+        if column is None and safe is not None and not safe & (safe - 1):
+            depth = 2
+            columns, values = self._root_values(board, depth, stats=stats, stop=stop)
+            column, value = (columns[0], 0) if None in values else self._pick(board, columns, values)
+        if column is not None:
+            if stats is not None:
+                stats.finish(column, value, depth)
+            return column, value, depth
+        column, value, depth = order_moves(board, board.turn, None, None)[0], 0, 0
+        for d in range(1, ROWS * COLS - board.moves + 1):
+            if stop is not None and stop.is_set():
+                break
+            if stats is not None:
+                stats.start_iteration(d)
+            columns, values = self._root_values(board, d, deadline, stats=stats, stop=stop)
+            if stats is not None:
+                stats.end_iteration(None not in values)
+            if None in values:
+                break
+            column, value = self._pick(board, columns, values)
+            depth = d
+            if value == math.inf or value == -math.inf:
+                break
+        if stats is not None:
+            stats.finish(column, value, depth)
+        return column, value, depth
+
+    def best_move(self, board, budget_ms, stats=None, book=None, stop=None):
+        return self.iterative_deepening(board, budget_ms, stats, book, stop)[0]
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,182 @@
+# Headless Connect4 self-play for training data: the engine plays itself over a process
+# pool and every searched position is written to disk with its search score and the
+# final outcome, for tuning evaluate_window or training a learned evaluation.
+#
+#   python connect4_selfplay.py --games 100000 --depth 5 --workers 8
+#   python connect4_selfplay.py --games 200000 --resume    continue the same run
+#
+# Game i opens with --random-plies random moves drawn from a generator seeded with
+# (seed, i), so games differ and a fixed depth replays them exactly whatever the number
+# of workers. Positions are written to numbered shards in the output directory,
+# shard_00000.npz, ... of about --shard-size positions each, whole games per shard,
+# with these arrays per position:
+#   boards   int8 (N, ROWS, COLS), EMPTY/PLAYER_PIECE/AI_PIECE, row 0 at the bottom
+#            (connect4_batch.score_positions takes them as they are)
+#   turn     int8, the piece to move
+#   move     int8, the column the engine played
+#   score    float32, the search value from the AI's point of view (inf for a win)
+#   outcome  int8, how the game ended for the piece to move: 1, 0 or -1
+#   game     int32, ply int8
+# Games are collected in order, at most a few per worker in flight, so memory stays
+# bounded however many games are played. After every shard progress.json records the
+# next game to play and the settings; --resume continues from it, replaying the games
+# that hadn't reached a shard yet.
+import argparse
+import json
+import math
+import os
+import random
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from connect4_engine import (AI_PIECE, COLS, H1, PLAYER_PIECE, ROWS, Search, TranspositionTable,
+                             get_valid_locations, is_terminal_node, iterative_deepening, minimax,
+                             position_from_moves, winning_move)
+
+PROGRESS_FILE = "progress.json"
+SETTINGS = ("seed", "depth", "budget_ms", "random_plies", "shard_size")
+# Bit of the cell at (row, col) in a bitboard
+CELL_SHIFTS = np.array([[c * H1 + r for c in range(COLS)] for r in range(ROWS)], dtype=np.uint64)
+
+# Transposition table of the worker process
+_table = None
+
+
+# Worker task: play game number game and return (player bitboard, AI bitboard, turn,
+# move, score, ply) of every searched position with the winning piece (0 for a draw)
+def play_game(game, seed, depth, budget_ms, random_plies):
+    global _table
+    if _table is None:
+        _table = TranspositionTable()
+    _table.clear()  # Every game searches the same way, whichever games the worker played before
+    rng = random.Random(seed * 1000003 + game)
+    board = position_from_moves([], PLAYER_PIECE if game % 2 == 0 else AI_PIECE)
+    records = []
+    while not is_terminal_node(board):
+        if board.moves < random_plies:
+            col = rng.choice(get_valid_locations(board))
+        else:
+            if depth is not None:
+                maximizing = board.turn == AI_PIECE
+                col, score = minimax(board, depth, -math.inf, math.inf, maximizing, _table, Search(_table))
+            else:
+                col, score, _ = iterative_deepening(board, budget_ms, _table)
+            records.append((board.boards[PLAYER_PIECE], board.boards[AI_PIECE], board.turn, col, score, board.moves))
+        piece = board.turn
+        board.make_move(col)
+        if winning_move(board, piece):
+            return records, piece
+    return records, 0
+
+
+# Arrays of a shard from (game, records, winner) of whole games
+def shard_arrays(games):
+    rows = [(game, winner) + record for game, records, winner in games for record in records]
+    player = np.array([row[2] for row in rows], dtype=np.uint64)
+    ai = np.array([row[3] for row in rows], dtype=np.uint64)
+    turn = np.array([row[4] for row in rows], dtype=np.int8)
+    winner = np.array([row[1] for row in rows], dtype=np.int8)
+    boards = (((player[:, None, None] >> CELL_SHIFTS) & 1) * PLAYER_PIECE
+              + ((ai[:, None, None] >> CELL_SHIFTS) & 1) * AI_PIECE).astype(np.int8)
+    outcome = np.where(winner == 0, 0, np.where(winner == turn, 1, -1)).astype(np.int8)
+    return {
+        "boards": boards,
+        "turn": turn,
+        "move": np.array([row[5] for row in rows], dtype=np.int8),
+        "score": np.array([row[6] for row in rows], dtype=np.float32),
+        "outcome": outcome,
+        "game": np.array([row[0] for row in rows], dtype=np.int32),
+        "ply": np.array([row[7] for row in rows], dtype=np.int8),
+    }
+
+
+# Write a shard and then the progress that includes it, each replacing its file in
+# one step, so a run stopped at any point resumes from the last complete shard
+def write_shard(directory, index, games, progress):
+    path = os.path.join(directory, f"shard_{index:05d}.npz")
+    with open(path + ".tmp", "wb") as f:
+        np.savez_compressed(f, **shard_arrays(games))
+    os.replace(path + ".tmp", path)
+    progress_path = os.path.join(directory, PROGRESS_FILE)
+    with open(progress_path + ".tmp", "w") as f:
+        json.dump(progress, f)
+    os.replace(progress_path + ".tmp", progress_path)
+
+
+# The arrays of every shard in directory, in order
+def read_shards(directory):
+    names = sorted(name for name in os.listdir(directory) if name.startswith("shard_") and name.endswith(".npz"))
+    for name in names:
+        with np.load(os.path.join(directory, name)) as shard:
+            yield {key: shard[key] for key in shard.files}
+
+
+def run(args):
+    os.makedirs(args.output, exist_ok=True)
+    settings = {name: getattr(args, name) for name in SETTINGS}
+    progress = {"next_game": 0, "shards": 0, "positions": 0, "settings": settings}
+    progress_path = os.path.join(args.output, PROGRESS_FILE)
+    if os.path.exists(progress_path):
+        if not args.resume:
+            raise SystemExit(f"{args.output} has a run already, pass --resume to continue it")
+        with open(progress_path) as f:
+            progress = json.load(f)
+        if progress["settings"] != settings:
+            raise SystemExit(f"{args.output} was played with {progress['settings']}")
+
+    first = progress["next_game"]
+    pending = deque()
+    games = []  # Finished games not in a shard yet
+    buffered = 0
+    start = time.perf_counter()
+    played = positions = 0
+    game = first
+    with ProcessPoolExecutor(args.workers) as pool:
+        while game < args.games or pending:
+            # Keep a few games per worker in flight and take them back in order
+            while game < args.games and len(pending) < 4 * args.workers:
+                pending.append((game, pool.submit(play_game, game, args.seed, args.depth, args.budget_ms,
+                                                  args.random_plies)))
+                game += 1
+            number, future = pending.popleft()
+            records, winner = future.result()
+            games.append((number, records, winner))
+            buffered += len(records)
+            played += 1
+            positions += len(records)
+            if buffered >= args.shard_size or (not pending and game == args.games):
+                progress["next_game"] = number + 1
+                progress["positions"] += buffered
+                progress["shards"] += 1
+                write_shard(args.output, progress["shards"] - 1, games, progress)
+                games, buffered = [], 0
+                elapsed = time.perf_counter() - start
+                print(f"games {first}-{number}: {played / elapsed:.1f} games/s, "
+                      f"{positions / elapsed:,.0f} positions/s, {progress['shards']} shards", flush=True)
+    elapsed = time.perf_counter() - start
+    print(f"{played} games, {positions} positions in {elapsed:.1f} s: {played / elapsed:.1f} games/s; "
+          f"{progress['positions']} positions in {progress['shards']} shards in {args.output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Connect4 self-play training data")
+    parser.add_argument("--games", type=int, default=1000, help="games in the whole run")
+    parser.add_argument("--depth", type=int, default=5, help="search depth of every move")
+    parser.add_argument("--budget-ms", type=int, help="search time per move instead of a fixed depth")
+    parser.add_argument("--random-plies", type=int, default=4, help="random opening moves of every game")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--shard-size", type=int, default=65536, help="positions per shard")
+    parser.add_argument("--output", default="selfplay")
+    parser.add_argument("--resume", action="store_true", help="continue the run in --output")
+    args = parser.parse_args()
+    if args.budget_ms is not None:
+        args.depth = None
+    run(args)
+
+
+if __name__ == "__main__":
+    main()
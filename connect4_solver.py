@@ -0,0 +1,240 @@
+# Exact Connect4 solver for small boards: the game-theoretic value of a position and
+# the move that wins fastest (or loses slowest), for perfect play and as ground truth
+# for the heuristic engine. Needs WINDOW_LENGTH 4.
+#
+#   python connect4_solver.py    solve every position of up to 4 moves, check how
+#                                often the engine's move keeps the value, and save the
+#                                solved results to connect4_solver.bin, where
+#                                Connect4AI.py loads them so its first moves are quick
+#
+# Scores are from the side to move and count how soon the game ends: winning with the
+# next move scores (CELLS + 1 - moves) // 2, one less for every further move the side
+# has to make before it wins, and losses mirror that; 0 is a draw. So the best score
+# is also the fastest win and the slowest loss.
+#
+# The search is negamax with alpha-beta over bitboards (the side to move's pieces and
+# the mask of all pieces, with the layout of connect4_engine). It never plays a move
+# that lets the opponent win next, answers forced moves at once, tries moves that
+# make the most threats first, and keeps bounds in a TranspositionTable. solve()
+# finds the exact score with null-window searches that halve the range of possible
+# scores each time, as in MTD(f). Tables can be saved and loaded to reuse solved
+# results between runs.
+import argparse
+import os
+import random
+import time
+
+from connect4_engine import (AI_PIECE, BOARD_MASK, BOTTOM_MASK, CENTER_ORDER, COLS, COLUMN_MASKS, LOWER, PLAYER_PIECE,
+                             ROWS, UPPER, WINDOW_LENGTH, SearchTimeout, TranspositionTable, best_move,
+                             get_valid_locations, is_terminal_node, position_from_moves, winning_cells, winning_move)
+
+SOLVER_TABLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "connect4_solver.bin")
+CELLS = ROWS * COLS
+
+
+# Division rounding towards zero, which the score bounds are defined with
+def _half(x):
+    return -(-x // 2) if x < 0 else x // 2
+
+
+class Solver:
+    def __init__(self, table=None, stop=None):
+        if WINDOW_LENGTH != 4:
+            raise ValueError("the solver only plays four in a row")
+        self.table = table if table is not None else TranspositionTable()
+        self.stop = stop  # Setting this threading.Event cancels the search with SearchTimeout
+        self.nodes = 0
+
+    # Score for the side to move, which can't win with its next move and has
+    # (alpha, beta) to search in. Scores outside the window are bounds.
+    def negamax(self, current, mask, moves, alpha, beta):
+        self.nodes += 1
+        if not self.nodes & 4095 and self.stop is not None and self.stop.is_set():
+            raise SearchTimeout
+
+        possible = (mask + BOTTOM_MASK) & BOARD_MASK
+        opponent_wins = winning_cells(current ^ mask, mask)
+        forced = possible & opponent_wins
+        if forced:
+            if forced & (forced - 1):
+                return -((CELLS - moves) // 2)  # Two threats: the opponent wins next move
+            possible = forced
+        possible &= ~(opponent_wins >> 1)  # Never play right below an opponent's winning cell
+        if not possible:
+            return -((CELLS - moves) // 2)
+        if moves >= CELLS - 2:
+            return 0
+
+        # The opponent can't win with their next move and neither can we
+        low = -((CELLS - 2 - moves) // 2)
+        high = (CELLS - 1 - moves) // 2
+        key = current + mask
+        entry = self.table.probe(key)
+        if entry is not None:
+            if entry[2] == LOWER:
+                low = max(low, int(entry[1]))
+            else:
+                high = min(high, int(entry[1]))
+        if alpha < low:
+            alpha = low
+        if beta > high:
+            beta = high
+        if alpha >= beta:
+            return alpha
+
+        # Moves that make the most threats first, center columns first on ties
+        children = []
+        for col in CENTER_ORDER:
+            move = possible & COLUMN_MASKS[col]
+            if move:
+                threats = winning_cells(current | move, mask).bit_count()
+                children.append((-threats, len(children), move, col))
+        children.sort()
+
+        opponent = current ^ mask
+        for _, _, move, col in children:
+            score = -self.negamax(opponent, mask | move, moves + 1, -beta, -alpha)
+            if score >= beta:
+                self.table.store(key, CELLS - moves, score, LOWER, col)
+                return score
+            if score > alpha:
+                alpha = score
+        self.table.store(key, CELLS - moves, alpha, UPPER, None)
+        return alpha
+
+    # Exact score of the position given by the side to move's pieces and the mask
+    def _solve(self, current, mask, moves):
+        if winning_cells(current, mask) & (mask + BOTTOM_MASK) & BOARD_MASK:
+            return (CELLS + 1 - moves) // 2
+        low = -((CELLS - moves) // 2)
+        high = (CELLS + 1 - moves) // 2
+        while low < high:
+            # Test the middle of the range, or nearer to 0 where most scores are
+            med = low + (high - low) // 2
+            if med <= 0 and _half(low) < med:
+                med = _half(low)
+            elif med >= 0 and _half(high) > med:
+                med = _half(high)
+            score = self.negamax(current, mask, moves, med, med + 1)
+            if score <= med:
+                high = score
+            else:
+                low = score
+        return low
+
+    # Exact score of board (a connect4_engine Position) for the piece to move
+    def solve(self, board):
+        if is_terminal_node(board):
+            raise ValueError("the game is over")
+        return self._solve(board.boards[board.turn], board.boards[1] | board.boards[2], board.moves)
+
+    # (column, score) of the best move for the piece to move: the fastest win, or
+    # the slowest loss. Ties go to the column nearest the center.
+    def best_move(self, board):
+        score = self.solve(board)
+        current = board.boards[board.turn]
+        mask = board.boards[1] | board.boards[2]
+        possible = (mask + BOTTOM_MASK) & BOARD_MASK
+        wins = winning_cells(current, mask) & possible
+        for col in CENTER_ORDER:
+            move = possible & COLUMN_MASKS[col]
+            if not move:
+                continue
+            if wins & move:
+                return col, score
+            child = current ^ mask, mask | move, board.moves + 1
+            # The child's score is -score exactly when the null window around it fails low
+            if winning_cells(*child[:2]) & ((child[1] + BOTTOM_MASK) & BOARD_MASK):
+                child_score = (CELLS + 1 - child[2]) // 2
+            else:
+                child_score = self.negamax(*child, -score, -score + 1)
+            if child_score <= -score:
+                return col, score
+        raise AssertionError("no move reaches the solved score")
+
+
+# Plies until the game ends with perfect play (counting the winning move) from a
+# position with moves pieces played and score for the side to move, or None for a draw
+def plies_to_end(moves, score):
+    if score == 0:
+        return None
+    # The winner moves last with moves_before pieces on the board, which has the
+    # parity of moves when the side to move wins
+    moves_before = CELLS + 1 - 2 * abs(score)
+    if (moves_before - moves - (score < 0)) % 2:
+        moves_before -= 1
+    return moves_before - moves + 1
+
+
+# Solve the best move of every position of up to ply moves, so a table saved
+# afterwards answers the opening at once. Returns the number of positions solved.
+def solve_openings(solver, ply):
+    frontier = [[]]
+    seen = set()
+    for _ in range(ply + 1):
+        children = []
+        for moves in frontier:
+            board = position_from_moves(moves, PLAYER_PIECE)
+            key = board.boards[board.turn] + (board.boards[1] | board.boards[2])
+            if key in seen or is_terminal_node(board):
+                continue
+            seen.add(key)
+            solver.best_move(board)
+            children.extend(moves + [col] for col in get_valid_locations(board))
+        frontier = children
+    return len(seen)
+
+
+# How often the heuristic engine's move (with budget_ms) keeps the solved outcome
+# (win, draw or loss) of positions from random games, as (kept, positions)
+def check_engine(count, budget_ms, solver, seed=1):
+    rng = random.Random(seed)
+    kept = checked = 0
+    while checked < count:
+        board = position_from_moves([], rng.choice((PLAYER_PIECE, AI_PIECE)))
+        for _ in range(rng.randrange(CELLS // 2, CELLS - 4)):
+            board.make_move(rng.choice(get_valid_locations(board)))
+            if is_terminal_node(board):
+                break
+        if is_terminal_node(board):
+            continue
+        score = solver.solve(board)
+        piece = board.turn
+        board.make_move(best_move(board.copy(), budget_ms))
+        if not is_terminal_node(board):
+            after = -solver.solve(board)
+        else:
+            after = 1 if winning_move(board, piece) else 0
+        checked += 1
+        kept += (score > 0) - (score < 0) == (after > 0) - (after < 0)
+    return kept, checked
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Solve Connect4 exactly and check the heuristic engine")
+    parser.add_argument("--positions", type=int, default=50, help="random positions to check the engine on")
+    parser.add_argument("--budget-ms", type=int, default=200, help="engine time per move")
+    parser.add_argument("--ply", type=int, default=4, help="solve every position of up to this many moves")
+    parser.add_argument("--table", default=SOLVER_TABLE_FILE, help="file to load solved results from and save them to")
+    args = parser.parse_args()
+    solver = Solver()
+    if os.path.exists(args.table):
+        solver.table.load(args.table)
+
+    board = position_from_moves([], PLAYER_PIECE)
+    start = time.perf_counter()
+    col, score = solver.best_move(board)
+    elapsed = time.perf_counter() - start
+    plies = plies_to_end(0, score)
+    outcome = "a draw" if plies is None else f"won by the {'first' if score > 0 else 'second'} player in {plies} plies"
+    print(f"{ROWS}x{COLS} empty board: {outcome}, best column {col}; {solver.nodes} nodes in {elapsed:.2f} s")
+    start = time.perf_counter()
+    count = solve_openings(solver, args.ply)
+    print(f"{count} positions of up to {args.ply} moves solved in {time.perf_counter() - start:.2f} s")
+    kept, checked = check_engine(args.positions, args.budget_ms, solver)
+    print(f"heuristic engine kept the solved outcome in {kept}/{checked} positions")
+    solver.table.save(args.table)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+# Stand-in client for engine_server.py: plays many Connect4 and TicTacToe games against
+# the server at once, each one the engine's best move against a random opponent, and
+# stops some searches early. Checks every answer and reports the search latency and
+# cache hits, so the server can be load tested without real players.
+#
+#   python engine_client.py --games 300 --workers 4    start a server on stdin/stdout
+#   python engine_client.py --port 7474                use a server already listening
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+from connect4_engine import PLAYER_PIECE, create_board, get_valid_locations
+from tictactoe_engine import Board
+
+SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "engine_server.py")
+
+
+class Client:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.waiting = {}  # Request id -> future of its answer
+        self.next_id = 0
+        self.requests = 0
+        self.listener = asyncio.create_task(self._listen())
+
+    async def _listen(self):
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                break
+            answer = json.loads(line)
+            future = self.waiting.pop(answer["id"], None)
+            if future is None:
+                raise RuntimeError(f"answer to no request: {answer}")
+            future.set_result(answer)
+        for future in self.waiting.values():
+            future.set_exception(ConnectionError("the server closed the connection"))
+
+    # Send request and return the future of its answer
+    def send(self, request):
+        self.next_id += 1
+        self.requests += 1
+        future = asyncio.get_running_loop().create_future()
+        self.waiting[self.next_id] = future
+        self.writer.write((json.dumps({"id": self.next_id, **request}) + "\n").encode())
+        return future
+
+    async def request(self, request):
+        answer = await self.send(request)
+        if not answer["ok"]:
+            raise RuntimeError(f"{request} failed: {answer['error']}")
+        return answer
+
+
+# Mirror of a game's board, to pick the random opponent's legal moves
+def _local_board(game, options):
+    if game == "connect4":
+        return create_board(options.get("first", PLAYER_PIECE))
+    return Board(options.get("size", 3), options.get("k"))
+
+def _legal_moves(game, board):
+    if game == "connect4":
+        return get_valid_locations(board)
+    return board.empty_cells()
+
+def _play(game, board, move):
+    if game == "connect4":
+        board.make_move(move)
+    else:
+        board.make_move(move, "O" if len(board.history) % 2 == 0 else "X")
+
+
+# Play one game; the engine moves for the side that moves second. Returns the final
+# status and every search latency in seconds.
+async def play_game(client, rng, budget_ms, stop_rate):
+    if rng.random() < 2 / 3:
+        game, options = "connect4", {}
+    else:
+        game, options = "tictactoe", {"size": rng.choice((3, 3, 4))}
+    session = (await client.request({"cmd": "new", "game": game, **options}))["session"]
+    board = _local_board(game, options)
+    latencies = []
+    status = "playing"
+    engine_turn = False
+    while status == "playing":
+        if engine_turn:
+            start = time.perf_counter()
+            answer = client.send({"cmd": "best", "session": session, "budget_ms": budget_ms})
+            if rng.random() < stop_rate:
+                await asyncio.sleep(rng.random() * budget_ms / 2000)
+                await client.request({"cmd": "stop", "session": session})
+            answer = await answer
+            if not answer["ok"]:
+                # Stopped while queued: ask again with a small budget
+                answer = await client.request({"cmd": "best", "session": session, "budget_ms": 10})
+            latencies.append(time.perf_counter() - start)
+            move = answer["move"]
+        else:
+            move = rng.choice(_legal_moves(game, board))
+        _play(game, board, move)
+        status = (await client.request({"cmd": "move", "session": session, "move": move}))["status"]
+        engine_turn = not engine_turn
+    await client.request({"cmd": "close", "session": session})
+    return status, latencies
+
+
+async def run(args):
+    process = None
+    if args.port is None:
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, SERVER, "--workers", str(args.workers),
+            stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, limit=1 << 20)
+        reader, writer = process.stdout, process.stdin
+    else:
+        reader, writer = await asyncio.open_connection("127.0.0.1", args.port)
+    client = Client(reader, writer)
+
+    rng = random.Random(args.seed)
+    start = time.perf_counter()
+    results = await asyncio.gather(*(play_game(client, random.Random(rng.random()), args.budget_ms, args.stop_rate)
+                                     for _ in range(args.games)))
+    elapsed = time.perf_counter() - start
+    stats = await client.request({"cmd": "stats"})
+
+    writer.close()
+    if process is not None:
+        await process.wait()
+    latencies = sorted(latency for _, game_latencies in results for latency in game_latencies)
+    statuses = [status for status, _ in results]
+    print(f"{args.games} games ({statuses.count('won')} won, {statuses.count('draw')} drawn) in {elapsed:.1f} s, "
+          f"{client.requests} requests, {client.requests / elapsed:.0f} requests/s")
+    print(f"{len(latencies)} engine moves: latency median {latencies[len(latencies) // 2] * 1000:.0f} ms, "
+          f"95th percentile {latencies[int(len(latencies) * 0.95)] * 1000:.0f} ms, "
+          f"max {latencies[-1] * 1000:.0f} ms")
+    print(f"{stats['searches']} searches, {stats['cache_hits']} answered from the cache")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play many games against engine_server.py at once")
+    parser.add_argument("--games", type=int, default=300)
+    parser.add_argument("--budget-ms", type=int, default=50, help="search budget of every engine move")
+    parser.add_argument("--stop-rate", type=float, default=0.1, help="fraction of searches stopped early")
+    parser.add_argument("--workers", type=int, default=2, help="search processes of the server started")
+    parser.add_argument("--port", type=int, help="connect to a server on 127.0.0.1 instead of starting one")
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,420 @@
+# Headless engine server for many games at once, Connect4 and TicTacToe alike. It
+# speaks JSON lines: every request is one JSON object on a line, answered by one JSON
+# object with the same "id" (answers to searches can come out of order).
+#
+#   python engine_server.py                  serve stdin/stdout
+#   python engine_server.py --port 7474      serve TCP connections on 127.0.0.1
+#
+# Requests, with their answers' extra fields (every answer has "id" and "ok"):
+#   {"cmd": "new", "game": "connect4", "first": 1}            "session", "to_move"
+#   {"cmd": "new", "game": "tictactoe", "size": 3, "k": 3, "first": "O"}
+#   {"cmd": "move", "session": "s1", "move": 3}               "status", "to_move"
+#   {"cmd": "best", "session": "s1", "budget_ms": 200}        "move", "value", "depth",
+#                                                             "cached", "stopped"
+#   {"cmd": "stop", "session": "s1"}
+#   {"cmd": "close", "session": "s1"}
+#   {"cmd": "stats"}                                          "sessions", "pending",
+#                                                             "searches", "cache_hits"
+# A failed request answers {"id": ..., "ok": false, "error": "..."}. Connect4 moves are
+# columns and pieces PLAYER_PIECE/AI_PIECE; TicTacToe moves are cell indices and
+# players "O"/"X". "status" is "playing", "won" (by the last move) or "draw". "value"
+# is for the side to move, "inf"/"-inf" for a forced Connect4 win or loss. A session
+# takes no move while its search runs; "stop" ends the search early with the best
+# move found so far ("stopped": true), or drops it if it hasn't started yet.
+#
+# Searches run in a fixed pool of worker processes, one search each at a time. Each
+# worker keeps one transposition table for every session it serves, so games reaching
+# the same positions share results. On top of that the server caches answers by
+# position: an exact answer (solved, or a full-depth TicTacToe search) serves every
+# later request, a timed one any request with no larger budget. Searches wait in a
+# queue of at most max_pending; when it's full the server stops reading requests
+# until a worker frees up, so a client sending faster than the engines search is held
+# back instead of growing the queue.
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import os
+import sys
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from connect4_engine import (AI_PIECE, COLS, PLAYER_PIECE, ROWS, TranspositionTable, create_board,
+                             is_valid_location, iterative_deepening, position_from_moves, winning_move)
+from tictactoe_engine import PLAYERS, Board, choose_move, default_depth
+
+DEFAULT_BUDGET_MS = 1000
+CACHE_SIZE = 100000  # Answers kept in the position cache
+
+# Search state of a worker process, created by _init_worker
+_table = None
+_stop = None
+
+def _init_worker(stop, table_mb):
+    global _table, _stop
+    _stop = stop
+    _table = TranspositionTable(table_mb)
+
+def _ready():
+    return os.getpid()
+
+# Worker task: (move, value for the side to move, depth, exact) for the position of
+# a session's state(), searched for budget_ms or until the worker's stop is set
+def _search(game, state, budget_ms):
+    if game == "connect4":
+        moves, first = state
+        board = position_from_moves(moves, first)
+        col, value, depth = iterative_deepening(board, budget_ms, _table, stop=_stop)
+        if board.turn == PLAYER_PIECE:
+            value = -value  # iterative_deepening values are for the AI
+        exact = math.isinf(value) or depth >= ROWS * COLS - board.moves
+        return col, value, depth, exact
+    size, k, history, player = state
+    board = Board(size, k)
+    for i, cell in enumerate(history):
+        board.make_move(cell, PLAYERS[(PLAYERS.index(player) + len(history) - i) % 2])
+    depth = default_depth(size)
+    move, value = choose_move(board, player, depth, stop=_stop)
+    if move is None:
+        move, value = board.candidate_moves(board.search_order)[0], 0  # Stopped before any move was searched
+    remaining = board.cells - len(history)
+    return move, value, remaining if depth is None else min(depth, remaining), depth is None
+
+
+class Connect4Session:
+    def __init__(self, first=PLAYER_PIECE):
+        if first not in (PLAYER_PIECE, AI_PIECE):
+            raise ValueError(f"first is {PLAYER_PIECE} or {AI_PIECE}")
+        self.board = create_board(first)
+        self.first = first
+        self.status = "playing"
+        self.job = None  # The search running or queued for this session
+
+    def to_move(self):
+        return self.board.turn
+
+    def play(self, col):
+        if not isinstance(col, int) or not 0 <= col < COLS or not is_valid_location(self.board, col):
+            raise ValueError(f"illegal move {col!r}")
+        piece = self.board.turn
+        self.board.make_move(col)
+        if winning_move(self.board, piece):
+            self.status = "won"
+        elif self.board.moves == ROWS * COLS:
+            self.status = "draw"
+
+    def state(self):
+        return self.board.history[:self.board.moves], self.first
+
+    def cache_key(self):
+        return "connect4", self.board.boards[PLAYER_PIECE], self.board.boards[AI_PIECE], self.board.turn
+
+
+class TicTacToeSession:
+    def __init__(self, size=3, k=None, first="O"):
+        if first not in PLAYERS:
+            raise ValueError("first is 'O' or 'X'")
+        if not isinstance(size, int) or not 3 <= size <= 10 or (k is not None and not 3 <= k <= size):
+            raise ValueError("size is 3 to 10 and k 3 to size")
+        self.board = Board(size, k)
+        self.player = first
+        self.status = "playing"
+        self.job = None
+
+    def to_move(self):
+        return self.player
+
+    def play(self, cell):
+        if not isinstance(cell, int) or not 0 <= cell < self.board.cells or self.board[cell] != " ":
+            raise ValueError(f"illegal move {cell!r}")
+        self.board.make_move(cell, self.player)
+        if self.board.last_move_won():
+            self.status = "won"
+        elif self.board.is_full():
+            self.status = "draw"
+        self.player = "X" if self.player == "O" else "O"
+
+    def state(self):
+        return self.board.size, self.board.k, self.board.history[:], self.player
+
+    def cache_key(self):
+        return "tictactoe", self.board.size, self.board.k, self.board.masks[0], self.board.masks[1], self.player
+
+
+GAMES = {"connect4": Connect4Session, "tictactoe": TicTacToeSession}
+
+
+# A best-move request waiting for or running in a worker
+class Job:
+    def __init__(self, request_id, session, budget_ms, reply):
+        self.request_id = request_id
+        self.session = session
+        self.budget_ms = budget_ms
+        self.reply = reply  # Writes the answer to the connection that asked
+        self.worker = None  # Index of the worker once it runs
+        self.dropped = False  # Stopped before it started
+        self.stopped = False
+
+
+def _json_value(value):
+    if isinstance(value, float) and math.isinf(value):
+        return "inf" if value > 0 else "-inf"  # JSON has no infinity
+    return value
+
+
+class EngineServer:
+    def __init__(self, workers=None, max_pending=None, table_mb=16, cache_size=CACHE_SIZE):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or 4 * self.workers
+        self.cache_size = cache_size
+        self.stops = [multiprocessing.Event() for _ in range(self.workers)]
+        # One single-process pool per worker, so a search's stop event is its worker's
+        self.pools = [ProcessPoolExecutor(1, initializer=_init_worker, initargs=(stop, table_mb))
+                      for stop in self.stops]
+        for pool in self.pools:
+            pool.submit(_ready).result()
+        self.sessions = {}
+        self.next_session = 0
+        self.cache = OrderedDict()  # cache_key() -> (budget_ms, answer), math.inf budget if exact
+        self.searches = 0
+        self.cache_hits = 0
+        self.jobs = None  # asyncio.Queue of Jobs, made by start() in the server's loop
+        self.dispatchers = []
+
+    async def start(self):
+        self.jobs = asyncio.Queue(self.max_pending)
+        self.dispatchers = [asyncio.create_task(self._dispatch(i)) for i in range(self.workers)]
+
+    async def close(self):
+        for task in self.dispatchers:
+            task.cancel()
+        for stop in self.stops:
+            stop.set()
+        for pool in self.pools:
+            pool.shutdown()
+
+    # Wait until every queued and running search has answered
+    async def drain(self):
+        await self.jobs.join()
+
+    # Take jobs off the queue and run them on worker index, one at a time
+    async def _dispatch(self, index):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self.jobs.get()
+            try:
+                if job.dropped:
+                    continue
+                session = job.session
+                self.stops[index].clear()
+                job.worker = index
+                future = self.pools[index].submit(_search, session.game, session.state(), job.budget_ms)
+                try:
+                    move, value, depth, exact = await asyncio.wrap_future(future, loop=loop)
+                except Exception as e:
+                    job.reply({"id": job.request_id, "ok": False, "error": f"search failed: {e}"})
+                    continue
+                self.searches += 1
+                answer = {"move": move, "value": _json_value(value), "depth": depth}
+                if not job.stopped:
+                    self._remember(session.cache_key(), math.inf if exact else job.budget_ms, answer)
+                job.reply({"id": job.request_id, "ok": True, **answer, "cached": False, "stopped": job.stopped})
+            finally:
+                if job.session.job is job:
+                    job.session.job = None
+                self.jobs.task_done()
+
+    def _remember(self, key, budget_ms, answer):
+        old = self.cache.get(key)
+        if old is None or old[0] < budget_ms:
+            self.cache[key] = (budget_ms, answer)
+        self.cache.move_to_end(key)
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def _session(self, request):
+        session = self.sessions.get(request.get("session"))
+        if session is None:
+            raise ValueError(f"no session {request.get('session')!r}")
+        return session
+
+    # Answer request, by calling reply with the answer. Searches are queued and
+    # answered later; this returns once the queue has taken them.
+    async def handle(self, request, reply, owned=None):
+        request_id = request.get("id")
+        try:
+            answer = await self._handle(request, reply, owned)
+        except ValueError as e:
+            answer = {"ok": False, "error": str(e)}
+        if answer is not None:
+            reply({"id": request_id, **answer})
+
+    async def _handle(self, request, reply, owned):
+        cmd = request.get("cmd")
+        if cmd == "new":
+            game = request.get("game")
+            if game not in GAMES:
+                raise ValueError(f"game is one of {', '.join(GAMES)}")
+            options = {name: request[name] for name in ("first", "size", "k") if name in request}
+            try:
+                session = GAMES[game](**options)
+            except TypeError:
+                raise ValueError(f"{game} takes {'first' if game == 'connect4' else 'size, k and first'}")
+            session.game = game
+            self.next_session += 1
+            session_id = f"s{self.next_session}"
+            self.sessions[session_id] = session
+            if owned is not None:
+                owned.add(session_id)
+            return {"ok": True, "session": session_id, "to_move": session.to_move()}
+
+        if cmd == "move":
+            session = self._session(request)
+            if session.job is not None:
+                raise ValueError("a search is running for this session")
+            if session.status != "playing":
+                raise ValueError("the game is over")
+            session.play(request.get("move"))
+            return {"ok": True, "status": session.status, "to_move": session.to_move()}
+
+        if cmd == "best":
+            session = self._session(request)
+            if session.job is not None:
+                raise ValueError("a search is running for this session")
+            if session.status != "playing":
+                raise ValueError("the game is over")
+            budget_ms = request.get("budget_ms", DEFAULT_BUDGET_MS)
+            if not isinstance(budget_ms, (int, float)) or budget_ms <= 0:
+                raise ValueError("budget_ms is a positive number")
+            cached = self.cache.get(session.cache_key())
+            if cached is not None and cached[0] >= budget_ms:
+                self.cache_hits += 1
+                self.cache.move_to_end(session.cache_key())
+                return {"ok": True, **cached[1], "cached": True, "stopped": False}
+            session.job = Job(request.get("id"), session, budget_ms, reply)
+            await self.jobs.put(session.job)  # Waits while the queue is full
+            return None
+
+        if cmd == "stop":
+            job = self._session(request).job
+            if job is not None:
+                job.stopped = True
+                if job.worker is None:
+                    job.dropped = True
+                    job.session.job = None
+                    job.reply({"id": job.request_id, "ok": False, "error": "stopped before it started"})
+                else:
+                    self.stops[job.worker].set()
+            return {"ok": True}
+
+        if cmd == "close":
+            session_id = request.get("session")
+            self._close_session(session_id)
+            if owned is not None:
+                owned.discard(session_id)
+            return {"ok": True}
+
+        if cmd == "stats":
+            return {"ok": True, "sessions": len(self.sessions), "pending": self.jobs.qsize(),
+                    "searches": self.searches, "cache_hits": self.cache_hits}
+
+        raise ValueError(f"unknown cmd {cmd!r}")
+
+    def _close_session(self, session_id):
+        session = self.sessions.pop(session_id, None)
+        if session is None:
+            raise ValueError(f"no session {session_id!r}")
+        job = session.job
+        if job is not None:
+            job.stopped = job.dropped = True
+            if job.worker is not None:
+                self.stops[job.worker].set()
+
+    # Serve one connection: read requests from reader until it closes, answering
+    # through write (a function taking a line of text). Its sessions close with it.
+    async def serve(self, reader, write):
+        owned = set()
+        def reply(answer):
+            write(json.dumps(answer) + "\n")
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("a request is a JSON object")
+                except ValueError as e:
+                    reply({"id": None, "ok": False, "error": f"bad request: {e}"})
+                    continue
+                await self.handle(request, reply, owned)
+        finally:
+            for session_id in owned:
+                self._close_session(session_id)
+
+
+async def _serve_stdio(server):
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+    def write(line):
+        sys.stdout.write(line)
+        sys.stdout.flush()
+    await server.serve(_DrainingReader(reader, server), write)
+
+
+# A reader that, at the end of the input, first waits for the queued searches, so
+# stdin closing after the last request still gets every answer
+class _DrainingReader:
+    def __init__(self, reader, server):
+        self.reader = reader
+        self.server = server
+
+    async def readline(self):
+        line = await self.reader.readline()
+        if not line:
+            await self.server.drain()
+        return line
+
+
+async def _serve_tcp(server, port):
+    async def connection(reader, writer):
+        try:
+            def write(line):
+                if not writer.is_closing():
+                    writer.write(line.encode())
+            await server.serve(reader, write)
+        finally:
+            writer.close()
+    tcp = await asyncio.start_server(connection, "127.0.0.1", port)
+    async with tcp:
+        await tcp.serve_forever()
+
+
+async def run(args):
+    server = EngineServer(args.workers, args.max_pending, args.table_mb)
+    await server.start()
+    try:
+        if args.port is None:
+            await _serve_stdio(server)
+        else:
+            await _serve_tcp(server, args.port)
+    finally:
+        await server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Connect4 and TicTacToe engine server (JSON lines)")
+    parser.add_argument("--port", type=int, help="serve TCP on 127.0.0.1 instead of stdin/stdout")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="search processes")
+    parser.add_argument("--max-pending", type=int, help="queued searches before reading pauses")
+    parser.add_argument("--table-mb", type=int, default=16, help="transposition table per worker")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+# Archive of played games: Connect4AI.py and both TicTacToe games append every game
+# to a record file, and the analyze command replays archived games through the
+# current engine to find the moves it would now play differently.
+#
+#   python game_records.py show games.rec                      list the games
+#   python game_records.py analyze games.rec --workers 8       compare with the engine
+#   python game_records.py analyze games.rec --flagged out.jsonl --depth 10
+#
+# File layout, little-endian: MAGIC once, then one record per game, appended as the
+# games end: a HEADER and one byte per move (the column in Connect4, the cell in the
+# tic-tac-toe family). A record is written in one call, so a file can be appended to
+# while it's read, and files are only ever read as a stream, a record at a time,
+# however large they grow.
+import argparse
+import itertools
+import json
+import math
+import os
+import struct
+import sys
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from connect4_engine import (AI_PIECE, COLS, PLAYER_PIECE, ROWS, TranspositionTable, first_player, last_move_won,
+                             minimax, moves_played, position_from_moves)
+from tictactoe_engine import PLAYERS, Board, choose_move, default_depth, negamax
+
+GAMES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "games.rec")
+MAGIC = b"GAMEREC1"
+# game, rows and columns (size and k for tic-tac-toe), first player, the side the
+# engine played, result, the seed of the game's random choices, number of moves
+HEADER = struct.Struct("<BBBBBBIH")
+CONNECT4, TICTACTOE = 0, 1
+GAME_NAMES = ("connect4", "tictactoe")
+# Players are numbered 0 and 1: PLAYER_PIECE and AI_PIECE in Connect4, "O" and "X"
+# in tic-tac-toe. The engine side is one of them, or BOTH_SIDES for engine games.
+BOTH_SIDES = 2
+DRAW, FIRST_WON, SECOND_WON, UNFINISHED = 0, 1, 2, 3
+RESULT_NAMES = ("draw", "first player won", "second player won", "unfinished")
+# Accuracy histogram buckets: games with 0-9%, 10-19%, ... and 100% of their moves
+# as good as the engine's
+BUCKETS = 11
+
+Game = namedtuple("Game", "game rows cols first engine result seed moves")
+
+
+# Result code of a game that first started and winner (a player number or None) won
+def result_code(first, winner, finished=True):
+    if not finished:
+        return UNFINISHED
+    if winner is None:
+        return DRAW
+    return FIRST_WON if winner == first else SECOND_WON
+
+
+# Append game to the record file at path, starting the file if it's new
+def append_game(path, game):
+    if len(game.moves) > 0xFFFF:
+        raise ValueError("a game has at most 65535 moves")
+    record = HEADER.pack(game.game, game.rows, game.cols, game.first, game.engine, game.result, game.seed,
+                         len(game.moves)) + bytes(game.moves)
+    with open(path, "ab") as f:
+        if f.tell() == 0:
+            record = MAGIC + record
+        f.write(record)
+
+
+# Every game in the record file at path, in order, read a record at a time
+def read_games(path):
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a game record file")
+        while True:
+            header = f.read(HEADER.size)
+            if not header:
+                return
+            if len(header) < HEADER.size:
+                raise ValueError(f"{path} ends in the middle of a record")
+            *fields, count = HEADER.unpack(header)
+            moves = f.read(count)
+            if len(moves) < count:
+                raise ValueError(f"{path} ends in the middle of a record")
+            yield Game(*fields, moves)
+
+
+# Game of a finished or abandoned Connect4 game on board (a connect4_engine.Position)
+def connect4_game(board, seed, engine_piece, finished=True):
+    pieces = (PLAYER_PIECE, AI_PIECE)
+    first = pieces.index(first_player(board))
+    winner = None
+    if board.moves and last_move_won(board):
+        winner = (first + board.moves - 1) % 2
+    engine = pieces.index(engine_piece) if engine_piece is not None else BOTH_SIDES
+    return Game(CONNECT4, ROWS, COLS, first, engine, result_code(first, winner, finished), seed,
+                moves_played(board))
+
+
+# Game of a finished or abandoned game on board (a tictactoe_engine.Board) where first
+# moved first
+def tictactoe_game(board, seed, first, engine_player, finished=True):
+    winner = board.winner()
+    if winner is not None:
+        winner = PLAYERS.index(winner)
+    engine = PLAYERS.index(engine_player) if engine_player is not None else BOTH_SIDES
+    first = PLAYERS.index(first)
+    return Game(TICTACTOE, board.size, board.k, first, engine, result_code(first, winner, finished), seed,
+                board.history)
+
+
+# Per-process state of the analysis workers
+_table = None
+
+
+# Every position of a Connect4 game: (player number to move, move played, value of
+# the move played, best value, the engine's move), values for the side to move
+def _connect4_positions(game, depth):
+    global _table
+    if _table is None:
+        _table = TranspositionTable()
+    _table.clear()
+    pieces = (PLAYER_PIECE, AI_PIECE)
+    board = position_from_moves([], pieces[game.first])
+    for col in game.moves:
+        piece = board.turn
+        sign = 1 if piece == AI_PIECE else -1
+        best, value = minimax(board, depth, -math.inf, math.inf, piece == AI_PIECE, _table)
+        played = value
+        if col != best:
+            board.make_move(col)
+            if last_move_won(board):
+                played = sign * math.inf
+            elif board.moves == ROWS * COLS:
+                played = 0
+            else:
+                played = minimax(board, depth - 1, -math.inf, math.inf, piece != AI_PIECE, _table)[1]
+            board.unmake_move()
+        yield pieces.index(piece), col, sign * played, sign * value, best
+        board.make_move(col)
+
+
+def _tictactoe_positions(game, depth):
+    board = Board(game.rows, game.cols)
+    me = game.first
+    for cell in game.moves:
+        best, value = choose_move(board, PLAYERS[me], depth)
+        played = value
+        if cell != best:
+            board.make_move(cell, PLAYERS[me])
+            if board.last_move_won():
+                played = 1
+            elif board.is_full():
+                played = 0
+            else:
+                remaining = board.cells - len(board.history)
+                played = -negamax(board, 1 - me, remaining if depth is None else depth - 1, -math.inf, math.inf)
+            board.unmake_move()
+        yield me, cell, played, value, best
+        board.make_move(cell, PLAYERS[me])
+        me = 1 - me
+
+
+# Worker task: analyze a list of games. Returns, per game,
+# [moves, moves as good as the engine's] for either player (None if the engine plays
+# another board size) and the moves the engine would play differently, as (ply,
+# player, move, value, engine move, engine value). depth None is the default depth
+# of each game.
+def analyze_games(games, depth):
+    results = []
+    for game in games:
+        if game.game == CONNECT4:
+            if (game.rows, game.cols) != (ROWS, COLS):
+                results.append((None, []))
+                continue
+            positions = _connect4_positions(game, depth or 8)
+        else:
+            positions = _tictactoe_positions(game, depth or default_depth(game.rows))
+        counts = [[0, 0], [0, 0]]
+        flagged = []
+        for ply, (player, move, value, best_value, best) in enumerate(positions):
+            counts[player][0] += 1
+            if value >= best_value:
+                counts[player][1] += 1
+            if move != best:
+                flagged.append((ply, player, move, value, best, best_value))
+        results.append((counts, flagged))
+    return results
+
+
+def _value_text(value):
+    if value == math.inf:
+        return "win"
+    if value == -math.inf:
+        return "loss"
+    return f"{value:g}"
+
+
+def show(args):
+    for number, game in enumerate(read_games(args.path)):
+        engine = "both" if game.engine == BOTH_SIDES else f"player {game.engine}"
+        print(f"{number}: {GAME_NAMES[game.game]} {game.rows}x{game.cols}, player {game.first} first, "
+              f"engine {engine}, {RESULT_NAMES[game.result]}, seed {game.seed}, {len(game.moves)} moves: "
+              f"{' '.join(map(str, game.moves))}")
+
+
+# Totals of an analysis: moves and games by accuracy, for the engine's side and the
+# other side, and the moves the engine would play differently
+class Report:
+    def __init__(self, show, flagged_path):
+        self.histograms = {"engine": [0] * BUCKETS, "player": [0] * BUCKETS}
+        self.moves = {"engine": [0, 0], "player": [0, 0]}  # [moves, moves as good as the engine's]
+        self.games = self.skipped = self.flagged = 0
+        self.show = show
+        self.flagged_file = open(flagged_path, "w") if flagged_path else None
+
+    def add(self, number, game, counts, flagged):
+        if counts is None:
+            self.skipped += 1
+            return
+        self.games += 1
+        for player, (moves, good) in enumerate(counts):
+            if moves:
+                side = "engine" if game.engine in (player, BOTH_SIDES) else "player"
+                self.histograms[side][good * (BUCKETS - 1) // moves] += 1
+                self.moves[side][0] += moves
+                self.moves[side][1] += good
+        for ply, player, move, value, best, best_value in flagged:
+            if self.flagged < self.show:
+                print(f"game {number} ply {ply}: player {player} played {move} ({_value_text(value)}), "
+                      f"engine {best} ({_value_text(best_value)})")
+            self.flagged += 1
+            if self.flagged_file is not None:
+                self.flagged_file.write(json.dumps({"game": number, "ply": ply, "player": player, "move": move,
+                                                    "value": _value_text(value), "engine_move": best,
+                                                    "engine_value": _value_text(best_value)}) + "\n")
+
+    def close(self):
+        if self.flagged_file is not None:
+            self.flagged_file.close()
+
+    def print(self, elapsed):
+        print(f"{self.games} games analyzed in {elapsed:.1f} s ({self.games / max(elapsed, 1e-9):.1f} games/s), "
+              f"{self.skipped} skipped for another board size, {self.flagged} moves the engine would play differently")
+        for side in ("engine", "player"):
+            moves, good = self.moves[side]
+            if not moves:
+                continue
+            print(f"{side} moves: {good}/{moves} as good as the engine's ({100 * good / moves:.1f}%); "
+                  f"games by accuracy:")
+            for bucket, games in enumerate(self.histograms[side]):
+                label = "100%" if bucket == BUCKETS - 1 else f"{bucket * 10}-{bucket * 10 + 9}%"
+                print(f"  {label:>7} {games}")
+
+
+def analyze(args):
+    games = enumerate(read_games(args.path))
+    chunks = iter(lambda: list(itertools.islice(games, args.chunk)), [])
+    report = Report(args.show, args.flagged)
+    start = time.perf_counter()
+    pending = deque()
+    with ProcessPoolExecutor(args.workers) as pool:
+        while True:
+            # Keep a few chunks per worker in flight and take them back in order, so the
+            # archive is read no faster than it's analyzed
+            while len(pending) < 4 * args.workers:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                pending.append((chunk, pool.submit(analyze_games, [game for _, game in chunk], args.depth)))
+            if not pending:
+                break
+            chunk, future = pending.popleft()
+            for (number, game), (counts, flagged) in zip(chunk, future.result()):
+                report.add(number, game, counts, flagged)
+            print(f"\r{report.games + report.skipped} games, {time.perf_counter() - start:.0f} s", end="",
+                  file=sys.stderr, flush=True)
+    print(file=sys.stderr)
+    report.close()
+    report.print(time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archived games: list them or analyze them with the engine")
+    commands = parser.add_subparsers(dest="command", required=True)
+    show_parser = commands.add_parser("show", help="list the games of a record file")
+    show_parser.add_argument("path", nargs="?", default=GAMES_FILE)
+    analyze_parser = commands.add_parser("analyze", help="replay games through the current engine")
+    analyze_parser.add_argument("path", nargs="?", default=GAMES_FILE)
+    analyze_parser.add_argument("--depth", type=int,
+                                help="search depth (default 8 for Connect4, the game's default for tic-tac-toe)")
+    analyze_parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    analyze_parser.add_argument("--chunk", type=int, default=16, help="games per worker task")
+    analyze_parser.add_argument("--show", type=int, default=20, help="print this many flagged moves")
+    analyze_parser.add_argument("--flagged", help="JSON lines file to write every flagged move to")
+    args = parser.parse_args()
+    if args.command == "show":
+        show(args)
+    else:
+        analyze(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# Search statistics for one move. Give a SearchStats to a search (Search(stats=...) and
+# iterative_deepening in connect4_engine, ParallelSearch, or tictactoe_engine.choose_move)
+# and it counts what the search did, so a slow move can be explained and a change to
+# move ordering can be checked. Searches without one only pay an "is None" test.
+#
+#   stats = SearchStats()
+#   col = best_move(board, 1000, table, stats)
+#   stats.append_to("moves.jsonl")    # one JSON object per move
+import json
+import math
+import time
+
+class SearchStats:
+    def __init__(self):
+        self.nodes = 0  # Positions visited, terminal ones included
+        self.evaluations = 0  # Leaves scored by the heuristic evaluation
+        self.terminal_hits = 0  # Won, lost or drawn positions reached
+        self.cutoffs = 0  # Beta cutoffs
+        self.first_move_cutoffs = 0  # Beta cutoffs by the first move searched
+        self.root = None  # Pieces on the board at the first node visited
+        self.max_ply = 0  # Pieces on the board at the deepest node visited
+        self.iterations = []  # {"depth", "nodes", "seconds", "completed"} per deepening iteration
+        self.move = None
+        self.value = None
+        self.depth = 0
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+        self._iteration = None
+
+    def node(self, ply):
+        self.nodes += 1
+        if self.root is None:
+            self.root = ply
+        if ply > self.max_ply:
+            self.max_ply = ply
+
+    def cutoff(self, first):
+        self.cutoffs += 1
+        if first:
+            self.first_move_cutoffs += 1
+
+    def start_iteration(self, depth):
+        self._iteration = (depth, self.nodes, time.perf_counter())
+
+    def end_iteration(self, completed=True):
+        depth, nodes, started = self._iteration
+        self.iterations.append({"depth": depth, "nodes": self.nodes - nodes,
+                                "seconds": time.perf_counter() - started, "completed": completed})
+
+    # Called by the search when it returns its move
+    def finish(self, move, value, depth):
+        self.move, self.value, self.depth = move, value, depth
+        self.seconds = time.perf_counter() - self.started
+
+    # Add the counters of a search run elsewhere (a worker process), given as_dict().
+    # plies is how far below this search's root that search started.
+    def merge(self, data, plies=0):
+        self.nodes += data["nodes"]
+        self.evaluations += data["evaluations"]
+        self.terminal_hits += data["terminal_hits"]
+        self.cutoffs += data["cutoffs"]
+        self.first_move_cutoffs += data["first_move_cutoffs"]
+        if self.root is None:
+            self.root = 0
+        self.max_ply = max(self.max_ply, self.root + data["max_depth"] + plies)
+
+    def max_depth(self):
+        return 0 if self.root is None else self.max_ply - self.root
+
+    def first_move_cutoff_rate(self):
+        return self.first_move_cutoffs / self.cutoffs if self.cutoffs else 0.0
+
+    def nodes_per_second(self):
+        return self.nodes / self.seconds if self.seconds else 0.0
+
+    def as_dict(self):
+        value = self.value
+        if value is not None and math.isinf(value):
+            value = "inf" if value > 0 else "-inf"  # JSON has no infinity
+        return {
+            "move": self.move,
+            "value": value,
+            "depth": self.depth,
+            "nodes": self.nodes,
+            "evaluations": self.evaluations,
+            "terminal_hits": self.terminal_hits,
+            "cutoffs": self.cutoffs,
+            "first_move_cutoffs": self.first_move_cutoffs,
+            "first_move_cutoff_rate": self.first_move_cutoff_rate(),
+            "max_depth": self.max_depth(),
+            "seconds": self.seconds,
+            "nodes_per_second": self.nodes_per_second(),
+            "iterations": self.iterations,
+        }
+
+    def to_json(self):
+        return json.dumps(self.as_dict())
+
+    # Append the stats as one line of a JSON lines file
+    def append_to(self, path):
+        with open(path, "a") as f:
+            f.write(self.to_json() + "\n")
@@ -0,0 +1,63 @@
+# Runs AI searches on a background thread so a GUI loop keeps drawing and handling
+# events while the AI thinks. The GUI starts a search with start() and calls poll()
+# from its own loop (every pygame frame, or from Tk's after()), so the result is
+# handled on the GUI thread.
+#
+# A search is a function of one argument, a threading.Event that is set when the
+# search is cancelled; it should check it now and then and return early once set.
+# Searches must work on their own copy of the board, since the GUI keeps reading it.
+import queue
+import threading
+
+class SearchWorker:
+    def __init__(self):
+        self.results = queue.Queue()
+        self.thread = None
+        self.stop = None
+        self.tag = None  # Tag of the search running or waiting to be polled
+        self.job = 0
+
+    # Cancel the running search and start search on a new thread. tag is handed back
+    # with the result, so the GUI can tell a ponder from a move search.
+    def start(self, search, tag=None):
+        self.cancel()
+        self.job += 1
+        self.tag = tag
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, args=(search, self.stop, self.job), daemon=True)
+        self.thread.start()
+
+    def _run(self, search, stop, job):
+        result = search(stop)
+        if not stop.is_set():
+            self.results.put((job, result))
+
+    # Stop the running search and wait for it, so no two searches share a table at
+    # once. Searches check for cancellation every few hundred nodes, so this is quick.
+    def cancel(self):
+        if self.thread is not None:
+            self.stop.set()
+            self.thread.join()
+            self.thread = None
+        self.tag = None
+
+    # The running search turned out to be the one wanted under another tag (a ponder
+    # on the move that was then played): hand its result back with tag instead
+    def retag(self, tag):
+        self.tag = tag
+
+    def busy(self):
+        return self.thread is not None
+
+    # (tag, result) of the search started last once it's done, otherwise None
+    def poll(self):
+        while True:
+            try:
+                job, result = self.results.get_nowait()
+            except queue.Empty:
+                return None
+            if job == self.job and self.thread is not None:
+                tag = self.tag
+                self.thread = None
+                self.tag = None
+                return tag, result
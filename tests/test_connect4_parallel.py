@@ -0,0 +1,61 @@
+import math
+import os
+import random
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from connect4_engine import AI_PIECE, get_valid_locations, is_terminal_node, minimax, position_from_moves
+from connect4_parallel import ParallelSearch
+
+
+@pytest.fixture(scope="module")
+def parallel():
+    with ParallelSearch(2) as search:
+        yield search
+
+
+def random_positions(count, seed=1):
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        board = position_from_moves([], rng.choice((1, 2)))
+        for _ in range(rng.randrange(0, 16)):
+            board.make_move(rng.choice(get_valid_locations(board)))
+            if is_terminal_node(board):
+                break
+        if not is_terminal_node(board):
+            positions.append(board)
+    return positions
+
+
+def serial(board, depth):
+    return minimax(board.copy(), depth, -math.inf, math.inf, board.turn == AI_PIECE)
+
+
+def test_forced_win_matches_serial(parallel):
+    board = position_from_moves([2, 3, 2, 2, 3, 3, 1, 0, 3, 4, 1], 2)
+    assert parallel.search(board, 5) == serial(board, 5)
+
+
+@pytest.mark.parametrize("depth", [1, 2, 3, 5])
+def test_parallel_matches_serial(parallel, depth):
+    for board in random_positions(40, seed=depth):
+        col, value = parallel.search(board, depth)
+        assert (col, value) == serial(board, depth)
+
+
+def test_stop_cancels_search(parallel):
+    board = position_from_moves([], 1)
+    stop = threading.Event()
+    threading.Timer(0.2, stop.set).start()
+    start = time.perf_counter()
+    col, _, _ = parallel.iterative_deepening(board, 60000, stop=stop)
+    assert time.perf_counter() - start < 5
+    assert col in get_valid_locations(board)
+    # The workers' searches run again once the cancelled one is over
+    assert parallel.search(board, 4) == serial(board, 4)
@@ -0,0 +1,15 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tictactoe_table import solution_table, verify
+
+
+def test_table_has_every_canonical_position():
+    assert len(solution_table()) == 627
+
+
+# verify() asserts that lookup() agrees with the search on each position where O is to move
+def test_table_matches_minimax_search():
+    assert verify() == 2423
@@ -0,0 +1,281 @@
+# Engine for the tic-tac-toe family: a size x size board where k in a row wins
+# (3x3 with 3 is tic-tac-toe; 4x4, 5x5 with 4 or 7x7 with 5 are larger variants).
+# TicTacToe.py and AnotherTicTacToe.py both play through Board and choose_move.
+#
+# Each player's pieces are one integer bitmask (bit i is cell i). Every line of k
+# cells is precomputed as a mask and indexed by the cells it passes through, so a
+# win check only tests the lines through the last move.
+import math
+
+PLAYERS = ("O", "X")
+# Bounds of the values analyze() gives, as in connect4_engine: exact, or an upper
+# bound for a move shown no better than the top_k best
+EXACT, UPPER = 0, 2
+# Boards with more cells than this only search cells next to pieces already played
+FULL_WIDTH_CELLS = 25
+
+_tables = {}
+
+
+# (all win lines, win lines through every cell, neighbour mask of every cell) for a
+# size x size board with k in a row, built once per board shape
+def board_tables(size, k):
+    if (size, k) not in _tables:
+        lines = []
+        for r in range(size):
+            for c in range(size):
+                for dr, dc in ((0, 1), (1, 0), (1, 1), (1, -1)):
+                    end_r, end_c = r + dr * (k - 1), c + dc * (k - 1)
+                    if 0 <= end_r < size and 0 <= end_c < size:
+                        lines.append(sum(1 << ((r + dr * i) * size + c + dc * i) for i in range(k)))
+        cell_lines = [tuple(line for line in lines if line >> i & 1) for i in range(size * size)]
+        neighbours = [sum(1 << (rr * size + cc)
+                          for rr in range(max(0, r - 1), min(size, r + 2))
+                          for cc in range(max(0, c - 1), min(size, c + 2)))
+                      for r in range(size) for c in range(size)]
+        _tables[size, k] = (lines, cell_lines, neighbours)
+    return _tables[size, k]
+
+
+class Board:
+    def __init__(self, size=3, k=None):
+        self.size = size
+        self.k = k or size
+        self.cells = size * size
+        self.lines, self.cell_lines, self.neighbours = board_tables(size, self.k)
+        self.masks = [0, 0]  # Pieces of O and X
+        self.history = []  # Undo stack of the cells played
+        self.full_mask = (1 << self.cells) - 1
+        # Search tries cells from the center outwards
+        center = (size - 1) / 2
+        self.search_order = sorted(range(self.cells),
+                                   key=lambda i: abs(i // size - center) + abs(i % size - center))
+
+    # board[i] is " ", "O" or "X" like the list boards the games used before
+    def __getitem__(self, i):
+        if self.masks[0] >> i & 1:
+            return "O"
+        if self.masks[1] >> i & 1:
+            return "X"
+        return " "
+
+    def __len__(self):
+        return self.cells
+
+    def __iter__(self):
+        return (self[i] for i in range(self.cells))
+
+    def copy(self):
+        board = Board.__new__(Board)
+        board.__dict__.update(self.__dict__)
+        board.masks = self.masks[:]
+        board.history = self.history[:]
+        return board
+
+    def make_move(self, i, player):
+        self.masks[PLAYERS.index(player)] |= 1 << i
+        self.history.append(i)
+
+    # Empty the cell of the last move
+    def unmake_move(self):
+        bit = 1 << self.history.pop()
+        self.masks[0] &= ~bit
+        self.masks[1] &= ~bit
+
+    def empty_cells(self):
+        occupied = self.masks[0] | self.masks[1]
+        return [i for i in range(self.cells) if not occupied >> i & 1]
+
+    def is_full(self):
+        return self.masks[0] | self.masks[1] == self.full_mask
+
+    # Only the lines through the last move can have been completed by it
+    def last_move_won(self):
+        i = self.history[-1]
+        mine = self.masks[0] if self.masks[0] >> i & 1 else self.masks[1]
+        for line in self.cell_lines[i]:
+            if mine & line == line:
+                return True
+        return False
+
+    # Player who won with the last move, or None
+    def winner(self):
+        if self.history and self.last_move_won():
+            return self[self.history[-1]]
+        return None
+
+    # Empty cells worth searching, in the given order. On large boards only cells next
+    # to a piece are searched (or the center of an empty board).
+    def candidate_moves(self, order):
+        occupied = self.masks[0] | self.masks[1]
+        if self.cells > FULL_WIDTH_CELLS:
+            if not occupied:
+                return [self.search_order[0]]
+            near = 0
+            for i in self.history:
+                near |= self.neighbours[i]
+            return [i for i in order if near >> i & 1 and not occupied >> i & 1]
+        return [i for i in order if not occupied >> i & 1]
+
+
+# Heuristic value for the player with masks[me] to move, strictly between -1 and 1:
+# every line still open for one player counts 4^(pieces in it) for that player
+def evaluate(board, me):
+    mine, theirs = board.masks[me], board.masks[1 - me]
+    score = 0
+    for line in board.lines:
+        if not line & theirs:
+            score += 4 ** (line & mine).bit_count() - 1
+        elif not line & mine:
+            score -= 4 ** (line & theirs).bit_count() - 1
+    return score / (len(board.lines) * 4 ** board.k)
+
+
+# Negamax with alpha-beta: value for the player with masks[me] to move, 1 for a win,
+# -1 for a loss, 0 for a draw, and evaluate() when depth runs out. stats (a
+# search_stats.SearchStats) is filled in when given.
+def negamax(board, me, depth, alpha, beta, stats=None):
+    if stats is not None:
+        stats.node(len(board.history))
+    if depth == 0:
+        if stats is not None:
+            stats.evaluations += 1
+        return evaluate(board, me)
+    player = PLAYERS[me]
+    best = -math.inf
+    moves = board.candidate_moves(board.search_order)
+    for i in moves:
+        board.make_move(i, player)
+        won = board.last_move_won()
+        if won or board.is_full():
+            score = 1 if won else 0
+            if stats is not None:
+                stats.node(len(board.history))
+                stats.terminal_hits += 1
+        else:
+            score = -negamax(board, 1 - me, depth - 1, -beta, -alpha, stats)
+        board.unmake_move()
+        if score > best:
+            best = score
+            if best > alpha:
+                alpha = best
+                if alpha >= beta:
+                    if stats is not None:
+                        stats.cutoff(i == moves[0])
+                    break
+    return best
+
+
+# Best cell for player and its value for player. max_depth limits the search to that
+# many plies, counting player's move; None searches to the end of the game. Root
+# moves are tried in cell order, so ties go to the lowest cell. Setting stop (a
+# threading.Event) ends the search after the root move being searched.
+def choose_move(board, player, max_depth=None, stats=None, stop=None):
+    me = PLAYERS.index(player)
+    depth = board.cells - len(board.history)
+    if max_depth is not None:
+        depth = min(depth, max_depth)
+    if stats is not None:
+        stats.start_iteration(depth)
+        stats.node(len(board.history))
+    best_move, best = None, -math.inf
+    for i in board.candidate_moves(range(board.cells)):
+        if stop is not None and stop.is_set():
+            break
+        board.make_move(i, player)
+        won = board.last_move_won()
+        if won or board.is_full():
+            score = 1 if won else 0
+            if stats is not None:
+                stats.node(len(board.history))
+                stats.terminal_hits += 1
+        else:
+            score = -negamax(board, 1 - me, depth - 1, -math.inf, -best, stats)
+        board.unmake_move()
+        if score > best:
+            best_move, best = i, score
+    if stats is not None:
+        stats.end_iteration()
+        stats.finish(best_move, best, depth)
+    return best_move, best
+
+
+# Multi-PV analysis: the value for player of every cell choose_move would consider,
+# from one search. Returns (lines, pv): lines are (cell, value, bound), best first
+# and ties in cell order, with bound EXACT, unless top_k is given: then only the
+# top_k best cells are searched exactly and the others only far enough to show they
+# are no better, an UPPER bound for far fewer nodes. pv is the expected line of play,
+# starting with the best cell. max_depth, stats and stop work as in choose_move;
+# cells not searched when stop is set are left out.
+def analyze(board, player, max_depth=None, top_k=None, stats=None, stop=None):
+    if top_k is not None and top_k < 1:
+        raise ValueError("top_k is at least 1")
+    me = PLAYERS.index(player)
+    depth = board.cells - len(board.history)
+    if max_depth is not None:
+        depth = min(depth, max_depth)
+    if stats is not None:
+        stats.start_iteration(depth)
+        stats.node(len(board.history))
+    lines = []
+    exact = []  # Values of the cells searched exactly
+    for i in board.candidate_moves(board.search_order):
+        if stop is not None and stop.is_set():
+            break
+        # Past top_k cells, only a cell better than the top_k-th best needs its value
+        threshold = -math.inf
+        if top_k is not None and len(exact) >= top_k:
+            threshold = sorted(exact, reverse=True)[top_k - 1]
+        if threshold == 1:
+            lines.append((i, 1, UPPER))  # top_k cells win already, so none can be better
+            continue
+        board.make_move(i, player)
+        won = board.last_move_won()
+        if won or board.is_full():
+            score = 1 if won else 0
+            if stats is not None:
+                stats.node(len(board.history))
+                stats.terminal_hits += 1
+        else:
+            score = -negamax(board, 1 - me, depth - 1, -math.inf, -threshold, stats)
+        board.unmake_move()
+        if threshold == -math.inf or score > threshold:
+            exact.append(score)
+            lines.append((i, score, EXACT))
+        else:
+            lines.append((i, score, UPPER))
+    lines.sort(key=lambda line: (line[2] != EXACT, -line[1], line[0]))
+    if stats is not None:
+        stats.end_iteration()
+        if lines:
+            stats.finish(lines[0][0], lines[0][1], depth)
+    return lines, principal_variation(board, player, lines[0][0], depth) if lines else []
+
+
+# The expected line of play after player plays cell: each side's choose_move in turn,
+# over the depth plies left
+def principal_variation(board, player, cell, depth):
+    pv = [cell]
+    me = PLAYERS.index(player)
+    board.make_move(cell, player)
+    while len(pv) < depth and not board.last_move_won() and not board.is_full():
+        me = 1 - me
+        move = choose_move(board, PLAYERS[me], depth - len(pv))[0]
+        pv.append(move)
+        board.make_move(move, PLAYERS[me])
+    for _ in pv:
+        board.unmake_move()
+    return pv
+
+
+# The cell player is most likely to play, from a two-ply search: a win, a block, or
+# the move that builds the most lines. The GUIs ponder on it during the player's turn.
+def predicted_move(board, player):
+    return choose_move(board, player, 2)[0]
+
+
+# Plies to search on a size x size board: exact on 3x3, shallower as boards grow
+def default_depth(size):
+    if size <= 3:
+        return None
+    return 4 if size == 4 else 3
@@ -0,0 +1,137 @@
+# Solved tic-tac-toe: every legal position (O moves first, as in TicTacToe.py) is
+# solved once and stored under its canonical key, so the AI's move is a lookup.
+#
+# A board is keyed by its base-3 number (cell i is digit i: 0 empty, 1 O, 2 X).
+# The canonical key is the smallest of the 8 keys of its rotations and reflections,
+# so symmetric positions share one entry. An entry packs the value for O
+# (-1, 0 or 1) with a 9-bit mask of the optimal moves in canonical cell order.
+#
+#   python tictactoe_table.py    checks the table against the tictactoe_engine search
+CELL_VALUES = {" ": 0, "O": 1, "X": 2}
+WIN_LINES = [(0, 1, 2), (3, 4, 5), (6, 7, 8),
+             (0, 3, 6), (1, 4, 7), (2, 5, 8),
+             (0, 4, 8), (2, 4, 6)]
+
+
+# The 8 symmetries of the board as permutations: symmetric board cell j is cell p[j]
+def _symmetries():
+    identity = tuple(range(9))
+    rotate = tuple(3 * (2 - j % 3) + j // 3 for j in range(9))
+    mirror = tuple(3 * (j // 3) + 2 - j % 3 for j in range(9))
+    perms = []
+    p = identity
+    for _ in range(4):
+        perms.append(p)
+        perms.append(tuple(p[mirror[j]] for j in range(9)))
+        p = tuple(p[rotate[j]] for j in range(9))
+    return perms
+
+
+SYMMETRIES = _symmetries()
+POWERS = [3 ** i for i in range(9)]
+
+# Built on first use by solution_table()
+_table = None
+
+
+def encode(cells):
+    return sum(CELL_VALUES[cells[i]] * POWERS[i] for i in range(9))
+
+
+# (canonical key, permutation that maps the board onto it)
+def canonical(cells):
+    return min((sum(CELL_VALUES[cells[p[j]]] * POWERS[j] for j in range(9)), p) for p in SYMMETRIES)
+
+
+def winner(cells):
+    for a, b, c in WIN_LINES:
+        if cells[a] != " " and cells[a] == cells[b] == cells[c]:
+            return cells[a]
+    return None
+
+
+# Value for O with the player to move, filling table with every non-terminal position
+def _solve(cells, player, table):
+    key, perm = canonical(cells)
+    entry = table.get(key)
+    if entry is not None:
+        return (entry >> 9) - 1
+    won = winner(cells)
+    if won is not None:
+        return 1 if won == "O" else -1
+    if " " not in cells:
+        return 0
+
+    values = []
+    for i in range(9):
+        if cells[i] == " ":
+            cells[i] = player
+            values.append((i, _solve(cells, "X" if player == "O" else "O", table)))
+            cells[i] = " "
+    best = max(v for _, v in values) if player == "O" else min(v for _, v in values)
+    # Store the optimal moves as canonical cells: board cell perm[j] is canonical cell j
+    inverse = {cell: j for j, cell in enumerate(perm)}
+    mask = 0
+    for i, v in values:
+        if v == best:
+            mask |= 1 << inverse[i]
+    table[key] = mask | (best + 1) << 9
+    return best
+
+
+def solution_table():
+    global _table
+    if _table is None:
+        table = {}
+        _solve([" "] * 9, "O", table)
+        _table = table
+    return _table
+
+
+# (best move, value for O) for the player to move on cells, or None if the game is
+# over or the position can't happen with O moving first. Ties go to the lowest cell,
+# like TicTacToe.ai_move.
+def lookup(cells):
+    key, perm = canonical(cells)
+    entry = solution_table().get(key)
+    if entry is None:
+        return None
+    moves = [perm[j] for j in range(9) if entry >> j & 1]
+    return min(moves), (entry >> 9) - 1
+
+
+# Every non-terminal position where O is to move, in games where O moves first
+def _o_to_move_positions(cells, player, seen):
+    if winner(cells) is not None or " " not in cells:
+        return
+    if player == "O":
+        key = encode(cells)
+        if key in seen:
+            return
+        seen.add(key)
+        yield cells[:]
+    for i in range(9):
+        if cells[i] == " ":
+            cells[i] = player
+            yield from _o_to_move_positions(cells, "X" if player == "O" else "O", seen)
+            cells[i] = " "
+
+
+# Compare the table with the exact search TicTacToe.py uses in minimax mode on every
+# position where O is to move
+def verify():
+    from tictactoe_engine import Board, choose_move
+
+    checked = 0
+    for cells in _o_to_move_positions([" "] * 9, "O", set()):
+        board = Board()
+        for i in range(9):
+            if cells[i] != " ":
+                board.make_move(i, cells[i])
+        assert lookup(cells) == choose_move(board, "O"), (cells, lookup(cells), choose_move(board, "O"))
+        checked += 1
+    return checked
+
+
+if __name__ == "__main__":
+    print(f"{len(solution_table())} canonical positions, {verify()} positions match the minimax search")